@@ -33,6 +33,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'skillswap.middleware.ViewerMiddleware',
     'skillswap.middleware.ActivityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -78,6 +79,15 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Cache used for block lists and other per-user lookups.
+# With several worker processes, point this at a shared backend so invalidation reaches every worker.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "skillswap"),
+    }
+}
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 
@@ -99,6 +109,33 @@ LOGOUT_REDIRECT_URL = 'skillswap:home'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Recommendation backend: "index" reads the precomputed table, "matrix" scores in memory (needs numpy)
+SKILLSWAP_RECOMMENDATION_BACKEND = os.environ.get("SKILLSWAP_RECOMMENDATION_BACKEND", "index")
+
+# Activity tracking: "sync" writes on the request, "buffered" batches writes per worker
+SKILLSWAP_ACTIVITY_MODE = os.environ.get("SKILLSWAP_ACTIVITY_MODE", "sync")
+# In buffered mode, flush after this many seconds or this many distinct users
+SKILLSWAP_ACTIVITY_FLUSH_INTERVAL = int(os.environ.get("SKILLSWAP_ACTIVITY_FLUSH_INTERVAL", "10"))
+SKILLSWAP_ACTIVITY_FLUSH_SIZE = int(os.environ.get("SKILLSWAP_ACTIVITY_FLUSH_SIZE", "100"))
+
+# Background tasks (match notifications). The immediate backend runs tasks synchronously, which suits
+# local development and tests; the Render config runs them on a background thread pool instead
+TASKS = {
+    "default": {
+        "BACKEND": os.environ.get("TASKS_BACKEND", "django.tasks.backends.immediate.ImmediateBackend"),
+    },
+}
+
+# Explore pages: "offset" shows numbered pages, "keyset" pages by cursor without counting the results
+SKILLSWAP_EXPLORE_PAGINATION = os.environ.get("SKILLSWAP_EXPLORE_PAGINATION", "offset")
+
+# Live chat delivery: the in-process broker only reaches streams in the same worker,
+# the database polling broker works across workers
+SKILLSWAP_REALTIME_BROKER = os.environ.get("SKILLSWAP_REALTIME_BROKER", "skillswap.realtime.InProcessBroker")
+SKILLSWAP_REALTIME_POLL_INTERVAL = float(os.environ.get("SKILLSWAP_REALTIME_POLL_INTERVAL", "2"))
+# Streams are closed after this many seconds and the browser reconnects
+SKILLSWAP_REALTIME_STREAM_SECONDS = int(os.environ.get("SKILLSWAP_REALTIME_STREAM_SECONDS", "300"))
+
 SECRET_KEY = os.environ.get("SECRET_KEY", SECRET_KEY)
 
 DEBUG = os.environ.get("DEBUG", "0") == "1"
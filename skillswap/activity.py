@@ -0,0 +1,89 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Case, CharField, DateTimeField, Value, When
+
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    """Collects last_active/last_path updates in memory and writes them with one UPDATE.
+
+    Writes happen on a daemon thread every SKILLSWAP_ACTIVITY_FLUSH_INTERVAL seconds, or as soon as
+    SKILLSWAP_ACTIVITY_FLUSH_SIZE users are waiting, so no request ever runs the batch UPDATE itself.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Only the latest visit per user is kept, so a busy user costs one entry
+        self._entries = {}
+        self._wake = threading.Event()
+        self._thread = None
+
+    def record(self, user_id, timestamp, path):
+        with self._lock:
+            self._entries[user_id] = (timestamp, path)
+            full = len(self._entries) >= settings.SKILLSWAP_ACTIVITY_FLUSH_SIZE
+            # Started on first use, and again in a forked worker where the parent's thread does not exist
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.SKILLSWAP_ACTIVITY_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception('Could not flush buffered activity; it stays buffered for the next try.')
+            finally:
+                # This thread opens its own database connection, so close it between flushes
+                connections.close_all()
+
+    def flush(self):
+        # Swap the entries out under the lock so new visits are not blocked by the write
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        if not entries:
+            return 0
+
+        try:
+            # A savepoint leaves a surrounding transaction usable if the write fails
+            with transaction.atomic():
+                Profile.objects.filter(user_id__in=list(entries)).update(
+                    last_active=Case(
+                        *[When(user_id=user_id, then=Value(timestamp)) for user_id, (timestamp, _) in entries.items()],
+                        output_field=DateTimeField(),
+                    ),
+                    last_path=Case(
+                        *[When(user_id=user_id, then=Value(path)) for user_id, (_, path) in entries.items()],
+                        output_field=CharField(),
+                    ),
+                )
+        except DatabaseError:
+            # Put the batch back, keeping any newer visit recorded while the write was failing
+            with self._lock:
+                for user_id, entry in entries.items():
+                    self._entries.setdefault(user_id, entry)
+            raise
+        return len(entries)
+
+
+activity_buffer = ActivityBuffer()
+
+
+@atexit.register
+def _flush_on_shutdown():
+    # Write whatever is still buffered when the worker exits
+    try:
+        activity_buffer.flush()
+    except DatabaseError:
+        logger.exception('Could not flush buffered activity on shutdown.')
@@ -72,7 +72,7 @@ class BlockAdmin(admin.ModelAdmin):
 # Admin config for conversations
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ('match', 'created_at')
+    list_display = ('match', 'created_at', 'last_message_at')
     search_fields = ('match__request__title', 'match__requester__username', 'match__partner__username')
 
 
@@ -0,0 +1,69 @@
+import bisect
+import unicodedata
+
+from .caching import VersionedWorkerCache
+from .models import Skill
+
+SKILL_INDEX_VERSION_KEY = 'skillswap:skill-index-version'
+
+# Most suggestions returned for one prefix
+SUGGESTION_LIMIT = 10
+
+
+def normalize(text):
+    # Case-folded, accents stripped and spaces collapsed, so "  Éclair Art" and "eclair art" share a key
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+class SkillPrefixIndex:
+    """Normalized skill names in sorted order, so every name starting with a prefix is one run found by bisect."""
+
+    def __init__(self, version):
+        self.version = version
+        self.skills = {}
+        names = []
+        words = []
+        for pk, name, category in Skill.objects.values_list('pk', 'name', 'category').order_by():
+            self.skills[pk] = {'id': pk, 'name': name, 'category': category}
+            key = normalize(name)
+            names.append((key, pk))
+            # Each later word starts an entry too, so "design" also finds "Web Design"
+            parts = key.split(' ')
+            words.extend((' '.join(parts[position:]), pk) for position in range(1, len(parts)))
+        self.names = sorted(names)
+        self.words = sorted(words)
+
+    @staticmethod
+    def _matching(entries, prefix):
+        index = bisect.bisect_left(entries, (prefix,))
+        while index < len(entries) and entries[index][0].startswith(prefix):
+            yield entries[index][1]
+            index += 1
+
+    def suggest(self, query, limit=SUGGESTION_LIMIT):
+        """Skills whose name, or a later word in it, starts with `query`; whole-name matches come first."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        found = []
+        for matches in (self._matching(self.names, prefix), self._matching(self.words, prefix)):
+            for pk in matches:
+                if len(found) == limit:
+                    break
+                if pk not in found:
+                    found.append(pk)
+        return [self.skills[pk] for pk in found]
+
+
+_skill_index = VersionedWorkerCache(SKILL_INDEX_VERSION_KEY, SkillPrefixIndex)
+
+
+def bump_skill_index_version():
+    _skill_index.bump()
+
+
+def get_skill_index():
+    """Return this worker's SkillPrefixIndex, rebuilding it when the shared version key has moved."""
+    return _skill_index.get()
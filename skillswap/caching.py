@@ -0,0 +1,48 @@
+import threading
+import uuid
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def invalidate_now_and_on_commit(keys):
+    """Delete cache `keys` now and again once the current transaction commits.
+
+    The second delete covers a concurrent request that re-cached the old values before this write was visible.
+    """
+    cache.delete_many(keys)
+    transaction.on_commit(partial(cache.delete_many, keys))
+
+
+class VersionedWorkerCache:
+    """One in-memory object per worker, rebuilt by `builder(version)` whenever the shared version key moves."""
+
+    def __init__(self, key, builder):
+        self.key = key
+        self.builder = builder
+        self._lock = threading.Lock()
+        self._value = None
+
+    def bump(self):
+        # Tell every worker that its copy is out of date
+        cache.set(self.key, uuid.uuid4().hex, None)
+
+    def current_version(self):
+        version = cache.get(self.key)
+        if version is None:
+            version = uuid.uuid4().hex
+            # add() keeps the value another worker may have set in the meantime
+            cache.add(self.key, version, None)
+            version = cache.get(self.key, version)
+        return version
+
+    def get(self):
+        version = self.current_version()
+        value = self._value
+        if value is None or value.version != version:
+            with self._lock:
+                if self._value is None or self._value.version != version:
+                    self._value = self.builder(version)
+                value = self._value
+        return value
@@ -1,18 +1,15 @@
-from django.db.models import Q
+from django.utils.functional import SimpleLazyObject
 
-from .models import Message, Notification
+from .middleware import get_viewer
 
 
 def unread_notifications(request):
     """Expose unread notification count to all templates."""
     # Only check notifications for logged-in users
     if request.user.is_authenticated:
-        return {
-            "unread_notifications_count": Notification.objects.filter(
-                user=request.user,
-                is_read=False,
-            ).count()
-        }
+        viewer = get_viewer(request)
+        # Lazy, so fragments rendered without the navbar never look it up
+        return {"unread_notifications_count": SimpleLazyObject(lambda: viewer.unread_counts[0])}
     # Guests should see 0 unread notifications
     return {"unread_notifications_count": 0}
 
@@ -20,15 +17,8 @@ def unread_notifications(request):
 def unread_messages(request):
     # Only count unread messages for authenticated users
     if request.user.is_authenticated:
-        return {
-            "unread_messages_count": Message.objects.filter(
-                # Find messages in conversations where the current user is one of the two matched users
-                Q(conversation__match__partner=request.user) | Q(conversation__match__requester=request.user),
-                is_read=False,
-            )
-            # Do not count messages sent by the current user
-            .exclude(sender=request.user)
-            .count()
-        }
+        viewer = get_viewer(request)
+        # Shares the same cached lookup as unread_notifications
+        return {"unread_messages_count": SimpleLazyObject(lambda: viewer.unread_counts[1])}
     # Guests should see 0 unread messages
-    return {"unread_messages_count": 0}
\ No newline at end of file
+    return {"unread_messages_count": 0}
@@ -0,0 +1,168 @@
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest
+
+from .caching import invalidate_now_and_on_commit
+from .models import Conversation, Match, Message, Notification, Profile
+from .pagination import keyset_filter
+
+NOTIFICATIONS = 'unread_notifications_count'
+MESSAGES = 'unread_messages_count'
+
+# Navbar counts are cached briefly; every counter change clears the entry
+UNREAD_CACHE_TIMEOUT = 30
+
+
+def _unread_cache_key(user_id):
+    return f'skillswap:unread:{user_id}'
+
+
+def invalidate_unread_cache(*user_ids):
+    invalidate_now_and_on_commit([_unread_cache_key(user_id) for user_id in user_ids if user_id is not None])
+
+
+def adjust_unread(user_id, field, delta):
+    # Change a counter in the database without reading it first (never below zero)
+    if delta:
+        Profile.objects.filter(user_id=user_id).update(**{field: Greatest(F(field) + delta, Value(0))})
+        invalidate_unread_cache(user_id)
+
+
+def _message_participants(message):
+    # (requester id, recipient id) for the match the message belongs to, or None if it is gone
+    participants = (
+        Match.objects.filter(conversation=message.conversation_id)
+        .values_list('requester_id', 'partner_id')
+        .first()
+    )
+    if participants is None:
+        return None
+    requester_id, partner_id = participants
+    # The recipient is whichever match participant did not send the message
+    if message.sender_id == requester_id:
+        return (requester_id, partner_id)
+    return (requester_id, requester_id)
+
+
+def record_new_message(message):
+    """Update the conversation snapshot and the recipient's unread counters for a new message."""
+    participants = _message_participants(message)
+    if participants is None:
+        return
+    requester_id, recipient_id = participants
+
+    updates = {
+        'last_message_at': message.created_at,
+        'last_message_preview': Conversation.preview(message.body),
+        'last_message_sender_id': message.sender_id,
+    }
+    if not message.is_read:
+        field = Conversation.unread_field(requester_id, recipient_id)
+        updates[field] = F(field) + 1
+    Conversation.objects.filter(pk=message.conversation_id).update(**updates)
+    if not message.is_read:
+        adjust_unread(recipient_id, MESSAGES, 1)
+
+
+def record_deleted_message(message):
+    """Undo a deleted message's unread count and point the snapshot at the latest remaining message."""
+    participants = _message_participants(message)
+    if participants is None:
+        return
+    requester_id, recipient_id = participants
+
+    latest = (
+        Message.objects.filter(conversation=message.conversation_id)
+        .order_by('-created_at', '-id')
+        .values_list('created_at', 'body', 'sender_id')
+        .first()
+    )
+    updates = {
+        'last_message_at': latest[0] if latest else None,
+        'last_message_preview': Conversation.preview(latest[1]) if latest else '',
+        'last_message_sender_id': latest[2] if latest else None,
+    }
+    if not message.is_read:
+        field = Conversation.unread_field(requester_id, recipient_id)
+        updates[field] = Greatest(F(field) - 1, Value(0))
+    Conversation.objects.filter(pk=message.conversation_id).update(**updates)
+    if not message.is_read:
+        adjust_unread(recipient_id, MESSAGES, -1)
+
+
+def mark_conversation_read(conversation, requester_id, user_id):
+    """Mark every message the other participant sent as read and return how many changed."""
+    marked = (
+        Message.objects.filter(conversation=conversation, is_read=False)
+        .exclude(sender_id=user_id)
+        .update(is_read=True)
+    )
+    if marked:
+        field = Conversation.unread_field(requester_id, user_id)
+        Conversation.objects.filter(pk=conversation.pk).update(**{field: 0})
+        setattr(conversation, field, 0)
+        adjust_unread(user_id, MESSAGES, -marked)
+    return marked
+
+
+# Order of the notification feed; a "before" cursor for mark-all-read uses the same ordering
+NOTIFICATION_ORDERING = ('-created_at', '-id')
+
+
+def mark_all_notifications_read(user_id, before=None):
+    """Mark a user's unread notifications read with one UPDATE; `before` limits it to that row and older."""
+    unread = Notification.objects.filter(user_id=user_id, is_read=False)
+    if before is not None:
+        created_at, pk = before
+        unread = unread.filter(keyset_filter(NOTIFICATION_ORDERING, before) | Q(created_at=created_at, pk=pk))
+    marked = unread.update(is_read=True)
+    adjust_unread(user_id, NOTIFICATIONS, -marked)
+    return marked
+
+
+def mark_all_conversations_read(user_id):
+    """Mark every message sent to a user read and clear their per-conversation counters."""
+    participant = Q(conversation__match__requester_id=user_id) | Q(conversation__match__partner_id=user_id)
+    marked = Message.objects.filter(participant, is_read=False).exclude(sender_id=user_id).update(is_read=True)
+    if marked:
+        Conversation.objects.filter(match__requester_id=user_id).exclude(requester_unread_count=0).update(
+            requester_unread_count=0
+        )
+        Conversation.objects.filter(match__partner_id=user_id).exclude(partner_unread_count=0).update(
+            partner_unread_count=0
+        )
+        adjust_unread(user_id, MESSAGES, -marked)
+    return marked
+
+
+def unread_counts(user):
+    """Return (unread notifications, unread messages) for a user from the cache or one lookup."""
+    key = _unread_cache_key(user.pk)
+    counts = cache.get(key)
+    if counts is None:
+        counts = Profile.objects.filter(user=user).values_list(NOTIFICATIONS, MESSAGES).first() or (0, 0)
+        cache.set(key, counts, UNREAD_CACHE_TIMEOUT)
+    return counts
+
+
+def actual_unread_counts():
+    """Count unread notifications and messages from scratch, as two Counters keyed by user id."""
+    notifications = Counter(dict(
+        Notification.objects.filter(is_read=False)
+        .values_list('user_id')
+        .annotate(total=Count('pk'))
+        .order_by()
+    ))
+
+    messages = Counter()
+    rows = (
+        Message.objects.filter(is_read=False)
+        .values_list('sender_id', 'conversation__match__requester_id', 'conversation__match__partner_id')
+        .annotate(total=Count('pk'))
+        .order_by()
+    )
+    for sender_id, requester_id, partner_id, total in rows:
+        messages[partner_id if sender_id == requester_id else requester_id] += total
+    return notifications, messages
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from django.urls import reverse_lazy
 
 from .models import Feedback, Match, Message, Profile, Report, Request, Skill, UserSkill
 
@@ -25,6 +26,18 @@ class BootstrapFormMixin:
                 field.widget.attrs.setdefault('class', 'form-check-input')
 
 
+class SkillAutocompleteSelect(forms.Select):
+    # Renders only the empty choice and the chosen skill; the page script loads the others from the
+    # autocomplete endpoint as the user types, so the whole skill table is never rendered
+    def __init__(self, attrs=None):
+        super().__init__({'data-autocomplete-url': reverse_lazy('skillswap:skill-autocomplete'), **(attrs or {})})
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [pk for pk in value if str(pk).isdigit()]
+        self.choices = [('', '---------'), *((skill.pk, str(skill)) for skill in Skill.objects.filter(pk__in=selected))]
+        return super().optgroups(name, value, attrs)
+
+
 class RegistrationForm(BootstrapFormMixin, UserCreationForm):
     # Require email during registration
     email = forms.EmailField(required=True)
@@ -85,6 +98,9 @@ class UserSkillForm(BootstrapFormMixin, forms.ModelForm):
     class Meta:
         model = UserSkill
         fields = ('skill', 'type', 'level', 'learning_months', 'self_rating')
+        widgets = {
+            'skill': SkillAutocompleteSelect(),
+        }
         help_texts = {
             'learning_months': 'Optional. Total months spent learning or practicing.',
             'self_rating': 'Optional. Rate your confidence from 1 (low) to 5 (high).',
@@ -132,6 +148,7 @@ class RequestForm(BootstrapFormMixin, forms.ModelForm):
         model = Request
         fields = ('skill', 'title', 'description', 'preferred_time', 'status')
         widgets = {
+            'skill': SkillAutocompleteSelect(),
             'description': forms.Textarea(attrs={'rows': 4}),
         }
 
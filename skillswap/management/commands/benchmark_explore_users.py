@@ -0,0 +1,100 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from skillswap.models import Skill, UserSkill
+
+User = get_user_model()
+
+SKILL_WORDS = ['Python', 'Piano', 'Spanish', 'Painting', 'Soccer', 'Guitar', 'Calculus', 'Chess', 'French', 'Design']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the explore users skill filter written as JOIN + DISTINCT with the EXISTS version on generated data. '
+        'Everything runs in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000, help='Number of generated users (default: 100000).')
+        parser.add_argument('--skills', type=int, default=500, help='Number of generated skills (default: 500).')
+        parser.add_argument('--per-user', type=int, default=4, help='Skill entries per user (default: 4).')
+        parser.add_argument('--skill', default='python', help='Skill name filter to benchmark (default: python).')
+        parser.add_argument('--type', default=UserSkill.SkillType.OFFER, choices=UserSkill.SkillType.values)
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query (default: 5).')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['skills'] < 1 or options['repeat'] < 1:
+            raise CommandError('--users, --skills and --repeat must be at least 1.')
+        per_user = min(max(options['per_user'], 1), options['skills'] * len(UserSkill.SkillType.values))
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            self._generate(options['users'], options['skills'], per_user)
+            self.stdout.write(
+                f'Generated {options["users"]} users with {per_user} skills each '
+                f'in {time.perf_counter() - started:.1f}s.'
+            )
+
+            base = User.objects.select_related('profile').filter(username__startswith='bench-')
+            # What the view ran before: two joins on the multi-valued relation, de-duplicated afterwards
+            joined = (
+                base.filter(user_skills__skill__name__icontains=options['skill'])
+                .filter(user_skills__type=options['type'])
+                .distinct()
+            )
+            skills = UserSkill.objects.filter(
+                user=OuterRef('pk'),
+                skill__name__icontains=options['skill'],
+                type=options['type'],
+            )
+            semi_join = base.filter(Exists(skills))
+
+            for label, queryset in [('JOIN + DISTINCT', joined), ('EXISTS', semi_join)]:
+                self._report(label, queryset, options['repeat'])
+            transaction.set_rollback(True)
+
+    def _generate(self, user_count, skill_count, per_user):
+        rng = random.Random(0)
+        skills = Skill.objects.bulk_create(
+            [Skill(name=f'{SKILL_WORDS[index % len(SKILL_WORDS)]} bench {index}') for index in range(skill_count)],
+            batch_size=1000,
+        )
+        pairs = [(skill.pk, skill_type) for skill in skills for skill_type in UserSkill.SkillType.values]
+        for start in range(0, user_count, 5000):
+            users = User.objects.bulk_create(
+                [User(username=f'bench-{index:07d}', password='!') for index in range(start, min(start + 5000, user_count))]
+            )
+            UserSkill.objects.bulk_create(
+                [
+                    UserSkill(user=user, skill_id=skill_id, type=skill_type, level=UserSkill.SkillLevel.BEGINNER)
+                    for user in users
+                    for skill_id, skill_type in rng.sample(pairs, per_user)
+                ],
+                batch_size=5000,
+            )
+        # Fresh statistics so the planner sees the generated tables as they are
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _report(self, label, queryset, repeat):
+        page = queryset.order_by('username', 'id')[:12]
+        timings = {'count': [], 'first page': []}
+        for _ in range(repeat):
+            started = time.perf_counter()
+            total = queryset.count()
+            timings['count'].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            list(page.all())
+            timings['first page'].append(time.perf_counter() - started)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{label}: {total} users'))
+        for name, values in timings.items():
+            self.stdout.write(f'  {name}: best {min(values) * 1000:.1f} ms of {repeat}')
+        self.stdout.write('  plan:')
+        for line in page.explain().splitlines():
+            self.stdout.write(f'    {line}')
@@ -0,0 +1,98 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from skillswap.counters import NOTIFICATIONS, adjust_unread
+from skillswap.models import Notification
+
+
+class Command(BaseCommand):
+    help = 'Delete old read notifications and collapse duplicate unread ones, in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=90,
+            help='Delete read notifications older than this many days (default: 90).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows deleted per transaction (default: 1000).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many rows would be removed without changing anything.',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days cannot be negative.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        stale = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+        duplicates = (
+            Notification.objects.filter(is_read=False, match__isnull=False)
+            .values('user_id', 'match_id', 'verb')
+            .annotate(newest=Max('pk'), total=Count('pk'))
+            .filter(total__gt=1)
+            .order_by()
+        )
+
+        if options['dry_run']:
+            duplicate_count = sum(group['total'] - 1 for group in duplicates)
+            self.stdout.write(f'Would delete {stale.count()} read notifications older than {options["days"]} days.')
+            self.stdout.write(f'Would collapse {duplicate_count} duplicate unread notifications.')
+            return
+
+        deleted = self._delete_stale(stale, options['batch_size'])
+        collapsed = self._collapse_duplicates(list(duplicates), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} read notifications older than {options["days"]} days '
+            f'and collapsed {collapsed} duplicate unread notifications.'
+        ))
+
+    def _delete_stale(self, stale, batch_size):
+        # Each batch commits on its own, so an interrupted run simply continues where it stopped next time
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(stale.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    return deleted
+                Notification.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+            self.stdout.write(f'Deleted {deleted} read notifications so far.')
+
+    def _collapse_duplicates(self, groups, batch_size):
+        # Keep the newest unread notification for each (user, match, verb) and drop the older copies
+        collapsed = 0
+        for start in range(0, len(groups), batch_size):
+            with transaction.atomic():
+                removed = Counter()
+                for group in groups[start:start + batch_size]:
+                    older = Notification.objects.filter(
+                        user_id=group['user_id'],
+                        match_id=group['match_id'],
+                        verb=group['verb'],
+                        is_read=False,
+                    ).exclude(pk=group['newest'])
+                    ids = list(older.values_list('pk', flat=True))
+                    # Mark them read first so the delete signal leaves the counters alone,
+                    # then adjust each user's counter once below
+                    Notification.objects.filter(pk__in=ids).update(is_read=True)
+                    Notification.objects.filter(pk__in=ids).delete()
+                    removed[group['user_id']] += len(ids)
+                for user_id, count in removed.items():
+                    adjust_unread(user_id, NOTIFICATIONS, -count)
+            collapsed += sum(removed.values())
+        return collapsed
@@ -0,0 +1,129 @@
+import datetime
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from skillswap.models import PartnerRecommendation, UserSkill
+from skillswap.scoring import build_skill_maps, init_worker, score_chunk
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored partner recommendations for every user (or only users changed since a time).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Only rebuild users whose skills changed at or after this ISO date/datetime.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes used for scoring (1 scores in this process).',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of users scored per task and written per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        since = self._parse_since(options['since'])
+        workers = max(options['workers'], 1)
+        chunk_size = max(options['chunk_size'], 1)
+
+        # Load the whole offer/want relation once instead of querying per user
+        entries = UserSkill.objects.values_list('user_id', 'skill_id', 'type').order_by()
+        skill_maps = build_skill_maps(entries.iterator())
+
+        if since is None:
+            user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        else:
+            user_ids = sorted(self._users_changed_since(since, skill_maps))
+
+        chunks = [user_ids[index:index + chunk_size] for index in range(0, len(user_ids), chunk_size)]
+        written = 0
+        if workers == 1 or len(chunks) <= 1:
+            init_worker(skill_maps)
+            for chunk in chunks:
+                written += self._write_chunk(*score_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(skill_maps,)) as pool:
+                for chunk_user_ids, rows in pool.map(score_chunk, chunks):
+                    written += self._write_chunk(chunk_user_ids, rows)
+
+        elapsed = time.perf_counter() - started
+        rate = len(user_ids) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt recommendations for {len(user_ids)} users ({written} rows) '
+            f'in {elapsed:.2f}s, {rate:.1f} users/sec.'
+        ))
+
+    def _parse_since(self, value):
+        if not value:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f'Invalid --since value: {value!r}')
+            since = datetime.datetime.combine(day, datetime.time.min)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def _users_changed_since(self, since, skill_maps):
+        wants, offers, _ = skill_maps
+        changed = set(UserSkill.objects.filter(updated_at__gte=since).values_list('user_id', flat=True))
+
+        # Learners who may have gained a row for a changed user
+        changed_offers = set().union(*(offers.get(user_id, set()) for user_id in changed))
+        affected = set(changed)
+        affected.update(user_id for user_id, want_ids in wants.items() if want_ids & changed_offers)
+        # Learners who already have a row for a changed user
+        affected.update(
+            PartnerRecommendation.objects.filter(candidate_id__in=changed).values_list('user_id', flat=True)
+        )
+        # Deleted skills leave no updated_at behind, so also take every learner with a stored row that no
+        # longer matches the current skills
+        stored = PartnerRecommendation.objects.values_list(
+            'user_id', 'candidate_id', 'overlap_want_offer', 'mutual_overlap').order_by()
+        empty = set()
+        affected.update(
+            user_id
+            for user_id, candidate_id, overlap, mutual in stored.iterator()
+            if user_id not in affected and (
+                len(wants.get(user_id, empty) & offers.get(candidate_id, empty)) != overlap
+                or len(offers.get(user_id, empty) & wants.get(candidate_id, empty)) != mutual
+            )
+        )
+        return affected
+
+    def _write_chunk(self, user_ids, rows):
+        # Replace each chunk of users in its own transaction to keep them short
+        with transaction.atomic():
+            PartnerRecommendation.objects.filter(user_id__in=user_ids).delete()
+            PartnerRecommendation.objects.bulk_create(
+                [
+                    PartnerRecommendation(
+                        user_id=user_id,
+                        candidate_id=candidate_id,
+                        overlap_want_offer=overlap,
+                        mutual_overlap=mutual,
+                        final_score=overlap + mutual,
+                    )
+                    for user_id, candidate_id, overlap, mutual in rows
+                ],
+                batch_size=1000,
+            )
+        return len(rows)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from skillswap import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of open requests.'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('This database has no search index; explore search falls back to substring matching.')
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} open requests.'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from skillswap.counters import MESSAGES, NOTIFICATIONS, actual_unread_counts, invalidate_unread_cache
+from skillswap.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Recount unread notifications and messages and fix profiles whose counters drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted profiles without changing them.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            notifications, messages = actual_unread_counts()
+
+            # Lock the profiles while comparing so new rows cannot slip in between count and update
+            drifted = []
+            profiles = Profile.objects.select_for_update().only('pk', 'user_id', NOTIFICATIONS, MESSAGES)
+            for profile in profiles.iterator():
+                expected = (notifications[profile.user_id], messages[profile.user_id])
+                if (profile.unread_notifications_count, profile.unread_messages_count) != expected:
+                    profile.unread_notifications_count, profile.unread_messages_count = expected
+                    drifted.append(profile)
+
+            if not options['dry_run']:
+                Profile.objects.bulk_update(drifted, [NOTIFICATIONS, MESSAGES], batch_size=500)
+                invalidate_unread_cache(*(profile.user_id for profile in drifted))
+
+        action = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{action} {len(drifted)} profiles with drifted unread counters.'))
@@ -1,25 +1,146 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
 from django.utils import timezone
 
+from .activity import activity_buffer
+from .counters import unread_counts
+from .models import Profile, block_sets
+
+# Activity is written at most once per this many seconds per session
+ACTIVITY_THROTTLE_SECONDS = 60
+# Session key holding the time of the last recorded visit (as a POSIX timestamp)
+LAST_ACTIVE_SESSION_KEY = '_skillswap_last_active'
+
+
+class Viewer:
+    """Per-request cache of the logged-in user's profile and block relationships."""
+
+    def __init__(self, request):
+        self._request = request
+        self._user_pk = None
+        self._values = {}
+
+    @property
+    def user(self):
+        return self._request.user
+
+    def _cached(self, name, load):
+        # Start over if the user logged in or out during the request
+        user = self.user
+        if user.pk != self._user_pk:
+            self._user_pk = user.pk
+            self._values = {}
+        if name not in self._values:
+            self._values[name] = load(user)
+        return self._values[name]
+
+    @property
+    def profile(self):
+        return self._cached('profile', lambda user: user.profile)
+
+    @property
+    def unread_counts(self):
+        # (notifications, messages) read once and shared by both context processors
+        return self._cached('unread_counts', unread_counts)
+
+    @property
+    def blocked_ids(self):
+        # Users blocked in either direction
+        blocked_ids, blocker_ids = self._cached('block_sets', block_sets)
+        return blocked_ids | blocker_ids
+
+    def is_blocked(self, other):
+        return other is not None and other.pk in self.blocked_ids
+
+    def has_blocked(self, other):
+        # Only the direction where the current user made the block
+        blocked_ids, _ = self._cached('block_sets', block_sets)
+        return other is not None and other.pk in blocked_ids
+
+
+def get_viewer(request):
+    # Views can be called without the middleware (e.g. from tests), so create the viewer on demand
+    viewer = getattr(request, 'viewer', None)
+    if viewer is None:
+        viewer = request.viewer = Viewer(request)
+    return viewer
+
+
+class ViewerMiddleware:
+    # Attach a Viewer so views share one profile and block lookup per request
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Creating the viewer does no I/O, so both modes can share this path
+        request.viewer = Viewer(request)
+        return self.get_response(request)
+
+
+def _activity_due(last_active, now):
+    # True when no visit was recorded in this session within the throttle window
+    return last_active is None or now.timestamp() - last_active > ACTIVITY_THROTTLE_SECONDS
+
 
 class ActivityMiddleware:
+    # Works natively under both WSGI and ASGI so uvicorn workers avoid a thread hop per request
+    sync_capable = True
+    async_capable = True
+
     # Save the next middleware or view function
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
         # First process the request and get the response
         response = self.get_response(request)
 
         # Only track activity for logged-in users
         if request.user.is_authenticated:
-            profile = request.user.profile
             now = timezone.now()
+            session = getattr(request, 'session', None)
+            # The session is already loaded for authentication, so this check costs no query
+            if session is not None and not _activity_due(session.get(LAST_ACTIVE_SESSION_KEY), now):
+                return response
+            if session is not None:
+                session[LAST_ACTIVE_SESSION_KEY] = now.timestamp()
+
+            if settings.SKILLSWAP_ACTIVITY_MODE == 'buffered':
+                # Hand the visit to the write-behind buffer instead of writing on this request
+                activity_buffer.record(request.user.pk, now, request.path)
+            else:
+                # Store the last visited path without loading the profile first
+                Profile.objects.filter(user_id=request.user.pk).update(last_active=now, last_path=request.path)
+
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+
+        user = await request.auser()
+        if user.is_authenticated:
+            now = timezone.now()
+            session = getattr(request, 'session', None)
+            if session is not None and not _activity_due(await session.aget(LAST_ACTIVE_SESSION_KEY), now):
+                return response
+            if session is not None:
+                await session.aset(LAST_ACTIVE_SESSION_KEY, now.timestamp())
 
-            # Update activity info if it has not been updated recently
-            if profile.last_active is None or (now - profile.last_active).total_seconds() > 60:
-                profile.last_active = now
-                # Store the last visited path
-                profile.last_path = request.path
-                profile.save(update_fields=['last_active', 'last_path'])
+            if settings.SKILLSWAP_ACTIVITY_MODE == 'buffered':
+                # Recording may flush the buffer, which uses the sync ORM
+                await sync_to_async(activity_buffer.record)(user.pk, now, request.path)
+            else:
+                await Profile.objects.filter(user_id=user.pk).aupdate(last_active=now, last_path=request.path)
 
-        return response
\ No newline at end of file
+        return response
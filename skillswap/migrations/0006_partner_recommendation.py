@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_recommendations(apps, schema_editor):
+    # Fill the new table from existing skills so recommendations do not disappear after upgrading
+    UserSkill = apps.get_model('skillswap', 'UserSkill')
+    PartnerRecommendation = apps.get_model('skillswap', 'PartnerRecommendation')
+
+    wants = defaultdict(set)
+    offers = defaultdict(set)
+    offered_by = defaultdict(set)
+    for user_id, skill_id, skill_type in UserSkill.objects.values_list('user_id', 'skill_id', 'type').iterator():
+        if skill_type == 'want':
+            wants[user_id].add(skill_id)
+        else:
+            offers[user_id].add(skill_id)
+            offered_by[skill_id].add(user_id)
+
+    rows = []
+    for user_id, want_ids in wants.items():
+        candidates = set().union(*(offered_by[skill_id] for skill_id in want_ids))
+        candidates.discard(user_id)
+        for candidate_id in candidates:
+            overlap = len(want_ids & offers[candidate_id])
+            mutual = len(wants[candidate_id] & offers[user_id])
+            rows.append(PartnerRecommendation(
+                user_id=user_id,
+                candidate_id=candidate_id,
+                overlap_want_offer=overlap,
+                mutual_overlap=mutual,
+                final_score=overlap + mutual,
+            ))
+    PartnerRecommendation.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    # This migration depends on the user model and the previous skillswap migration
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('skillswap', '0005_block_conversation_message_report'),
+    ]
+
+    operations = [
+        # Precomputed partner recommendations, one row per learner-candidate pair
+        migrations.CreateModel(
+            name='PartnerRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('overlap_want_offer', models.PositiveIntegerField(default=0)),
+                ('mutual_overlap', models.PositiveIntegerField(default=0)),
+                ('final_score', models.PositiveIntegerField(default=0)),
+                # User who could teach the learner
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                related_name='recommended_to', to=settings.AUTH_USER_MODEL)),
+                # User the recommendation is shown to
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                           related_name='partner_recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-final_score', '-overlap_want_offer'],
+                'indexes': [models.Index(fields=['user', '-final_score', '-overlap_want_offer'],
+                                         name='partner_rec_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'candidate'),
+                                                        name='unique_partner_recommendation')],
+            },
+        ),
+        migrations.RunPython(backfill_recommendations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    # This migration is based on the partner recommendation migration
+    dependencies = [
+        ('skillswap', '0006_partner_recommendation'),
+    ]
+
+    operations = [
+        # Track when a user skill was last changed (existing rows get the migration time)
+        migrations.AddField(
+            model_name='userskill',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
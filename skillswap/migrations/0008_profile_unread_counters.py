@@ -0,0 +1,53 @@
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_counters(apps, schema_editor):
+    # Start the counters from the rows that are already unread
+    Profile = apps.get_model('skillswap', 'Profile')
+    Notification = apps.get_model('skillswap', 'Notification')
+    Message = apps.get_model('skillswap', 'Message')
+
+    notifications = Counter(dict(
+        Notification.objects.filter(is_read=False).values_list('user_id').annotate(total=Count('pk')).order_by()
+    ))
+    messages = Counter()
+    rows = (
+        Message.objects.filter(is_read=False)
+        .values_list('sender_id', 'conversation__match__requester_id', 'conversation__match__partner_id')
+        .annotate(total=Count('pk'))
+        .order_by()
+    )
+    for sender_id, requester_id, partner_id, total in rows:
+        messages[partner_id if sender_id == requester_id else requester_id] += total
+
+    for user_id in set(notifications) | set(messages):
+        Profile.objects.filter(user_id=user_id).update(
+            unread_notifications_count=notifications[user_id],
+            unread_messages_count=messages[user_id],
+        )
+
+
+class Migration(migrations.Migration):
+    # This migration is based on the user skill updated_at migration
+    dependencies = [
+        ('skillswap', '0007_userskill_updated_at'),
+    ]
+
+    operations = [
+        # Unread notification counter shown in the navbar
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notifications_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        # Unread message counter shown in the navbar
+        migrations.AddField(
+            model_name='profile',
+            name='unread_messages_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
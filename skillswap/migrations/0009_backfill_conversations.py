@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def create_missing_conversations(apps, schema_editor):
+    # Accepted/completed matches from before conversations were created eagerly may lack one
+    Match = apps.get_model('skillswap', 'Match')
+    Conversation = apps.get_model('skillswap', 'Conversation')
+
+    match_ids = (
+        Match.objects.filter(status__in=['accepted', 'completed'], conversation__isnull=True)
+        .values_list('pk', flat=True)
+    )
+    Conversation.objects.bulk_create(
+        [Conversation(match_id=match_id) for match_id in match_ids.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    # This migration is based on the unread counter migration
+    dependencies = [
+        ('skillswap', '0008_profile_unread_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_snapshots(apps, schema_editor):
+    # Fill the snapshot and unread counts from the messages that already exist
+    Conversation = apps.get_model('skillswap', 'Conversation')
+    Message = apps.get_model('skillswap', 'Message')
+
+    for conversation in Conversation.objects.select_related('match').iterator():
+        messages = Message.objects.filter(conversation=conversation)
+        latest = messages.order_by('-created_at', '-id').first()
+        if latest is None:
+            continue
+        body = latest.body
+        conversation.last_message_at = latest.created_at
+        conversation.last_message_preview = body if len(body) <= 120 else body[:119] + '…'
+        conversation.last_message_sender_id = latest.sender_id
+        unread = messages.filter(is_read=False)
+        conversation.requester_unread_count = unread.exclude(sender_id=conversation.match.requester_id).count()
+        conversation.partner_unread_count = unread.exclude(sender_id=conversation.match.partner_id).count()
+        conversation.save(update_fields=[
+            'last_message_at',
+            'last_message_preview',
+            'last_message_sender',
+            'requester_unread_count',
+            'partner_unread_count',
+        ])
+
+
+class Migration(migrations.Migration):
+    # This migration is based on the conversation backfill migration
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('skillswap', '0009_backfill_conversations'),
+    ]
+
+    operations = [
+        # Latest message snapshot used to list and sort the inbox
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                    related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        # Unread messages per participant
+        migrations.AddField(
+            model_name='conversation',
+            name='requester_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='partner_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
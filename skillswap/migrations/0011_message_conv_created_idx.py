@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # This migration is based on the conversation snapshot migration
+    dependencies = [
+        ('skillswap', '0010_conversation_last_message_snapshot'),
+    ]
+
+    operations = [
+        # Index for paging through a conversation by (created_at, id)
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='message_conv_created_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django.db import OperationalError, migrations, transaction
+
+# The table as it was defined when this migration was written; skillswap/search.py keeps its rows current
+# with the same columns
+SEARCH_TABLE = 'skillswap_request_search'
+
+
+def create_search_index(apps, schema_editor):
+    db = schema_editor.connection
+    request_table = apps.get_model('skillswap', 'Request')._meta.db_table
+    skill_table = apps.get_model('skillswap', 'Skill')._meta.db_table
+
+    # Only SQLite (FTS5) and PostgreSQL get an index; other databases keep the icontains search
+    if db.vendor == 'sqlite':
+        create = [
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "title, description, skill_name, tokenize = 'unicode61 remove_diacritics 2')",
+        ]
+        backfill = (
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, skill_name) '
+            'SELECT r.id, r.title, r.description, s.name'
+        )
+    elif db.vendor == 'postgresql':
+        create = [
+            f'CREATE TABLE {SEARCH_TABLE} ('
+            f'request_id bigint PRIMARY KEY REFERENCES {request_table} (id) '
+            'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)',
+            f'CREATE INDEX {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING gin (document)',
+        ]
+        backfill = (
+            f'INSERT INTO {SEARCH_TABLE} (request_id, document) '
+            "SELECT r.id, setweight(to_tsvector('simple', r.title), 'A') "
+            "|| setweight(to_tsvector('simple', s.name), 'B') "
+            "|| setweight(to_tsvector('simple', r.description), 'C')"
+        )
+    else:
+        return
+
+    try:
+        # A savepoint keeps the migration usable if FTS5 is not compiled into SQLite
+        with transaction.atomic(using=db.alias):
+            for statement in create:
+                schema_editor.execute(statement)
+    except OperationalError:
+        return
+    # Only open requests are searchable
+    schema_editor.execute(
+        f'{backfill} FROM {request_table} r JOIN {skill_table} s ON s.id = r.skill_id WHERE r.status = %s',
+        ['open'],
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+    # This migration is based on the notification index migration
+    dependencies = [
+        ('skillswap', '0012_notif_user_read_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # This migration is based on the search index migration
+    dependencies = [
+        ('skillswap', '0013_request_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='partnerrecommendation',
+            options={'ordering': ['-final_score', '-overlap_want_offer', 'candidate']},
+        ),
+        # The candidate id breaks score ties, so it joins the index and the read needs no extra sort
+        migrations.RemoveIndex(
+            model_name='partnerrecommendation',
+            name='partner_rec_score_idx',
+        ),
+        migrations.AddIndex(
+            model_name='partnerrecommendation',
+            index=models.Index(
+                fields=['user', '-final_score', '-overlap_want_offer', 'candidate'], name='partner_rec_score_idx'
+            ),
+        ),
+    ]
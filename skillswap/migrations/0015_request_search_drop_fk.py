@@ -0,0 +1,32 @@
+from django.db import migrations
+
+SEARCH_TABLE = 'skillswap_request_search'
+# PostgreSQL's name for the inline REFERENCES constraint created by migration 0013
+CONSTRAINT = f'{SEARCH_TABLE}_request_id_fkey'
+
+
+def drop_request_fk(apps, schema_editor):
+    # TRUNCATE (flush, TransactionTestCase teardown) refuses a referenced table even with ON DELETE CASCADE,
+    # and Django never truncates this unmanaged table, so it keeps no foreign key. The post_delete signal
+    # removes a deleted request's row instead
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'ALTER TABLE IF EXISTS {SEARCH_TABLE} DROP CONSTRAINT IF EXISTS {CONSTRAINT}')
+
+
+def add_request_fk(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        request_table = apps.get_model('skillswap', 'Request')._meta.db_table
+        schema_editor.execute(
+            f'ALTER TABLE IF EXISTS {SEARCH_TABLE} ADD CONSTRAINT {CONSTRAINT} FOREIGN KEY (request_id) '
+            f'REFERENCES {request_table} (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED'
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('skillswap', '0014_partner_rec_score_idx_candidate'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_request_fk, add_request_fk),
+    ]
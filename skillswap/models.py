@@ -1,10 +1,15 @@
 from django.conf import settings
+from django.core.cache import cache
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models import F, Q
+from django.dispatch import Signal
 from django.urls import reverse
+from django.utils import timezone
+
+from .caching import invalidate_now_and_on_commit
 
 User = settings.AUTH_USER_MODEL
 
@@ -48,6 +53,10 @@ class Profile(models.Model):
     last_active = models.DateTimeField(null=True, blank=True)
     last_path = models.CharField(max_length=255, null=True, blank=True)
 
+    # Unread counters shown in the navbar, kept in step by skillswap.counters
+    unread_notifications_count = models.PositiveIntegerField(default=0)
+    unread_messages_count = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return f"Profile for {self.user.username}"
 
@@ -143,6 +152,8 @@ class UserSkill(models.Model):
         validators=[MinValueValidator(1), MaxValueValidator(5)],
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Lets batch jobs find skills that changed since their last run
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -161,6 +172,33 @@ class UserSkill(models.Model):
         super().save(*args, **kwargs)
 
 
+class PartnerRecommendation(models.Model):
+    # Precomputed score for how well `candidate` can teach what `user` wants to learn
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='partner_recommendations')
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommended_to')
+    # Skills the user wants that the candidate offers
+    overlap_want_offer = models.PositiveIntegerField(default=0)
+    # Skills the candidate wants that the user offers
+    mutual_overlap = models.PositiveIntegerField(default=0)
+    final_score = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Only one row for each user-candidate pair
+            models.UniqueConstraint(fields=['user', 'candidate'], name='unique_partner_recommendation'),
+        ]
+        indexes = [
+            # Lets the recommendation page read one user's rows already sorted by score, ties by candidate id
+            models.Index(
+                fields=['user', '-final_score', '-overlap_want_offer', 'candidate'], name='partner_rec_score_idx'
+            ),
+        ]
+        ordering = ['-final_score', '-overlap_want_offer', 'candidate']
+
+    def __str__(self):
+        return f"{self.candidate} for {self.user} ({self.final_score})"
+
+
 class Request(models.Model):
     # Current status of a learning/help request
     class Status(models.TextChoices):
@@ -185,6 +223,10 @@ class Request(models.Model):
         return reverse('skillswap:request-detail', kwargs={'pk': self.pk})
 
 
+# Sent by Match.transition() after a status change, with the instance and its previous_status
+match_status_changed = Signal()
+
+
 class Match(models.Model):
     # Status for a match between requester and partner
     class Status(models.TextChoices):
@@ -193,6 +235,13 @@ class Match(models.Model):
         REJECTED = 'rejected', 'Rejected'
         COMPLETED = 'completed', 'Completed'
 
+    # The only status each status can be reached from
+    TRANSITIONS = {
+        Status.ACCEPTED: Status.PENDING,
+        Status.REJECTED: Status.PENDING,
+        Status.COMPLETED: Status.ACCEPTED,
+    }
+
     request = models.ForeignKey(Request, on_delete=models.CASCADE, related_name='matches')
     requester = models.ForeignKey(User, on_delete=models.CASCADE, related_name='requested_matches')
     partner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='partner_matches')
@@ -219,11 +268,46 @@ class Match(models.Model):
     def get_absolute_url(self):
         return reverse('skillswap:match-detail', kwargs={'pk': self.pk})
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored status, so a later save() can tell whether it changed it
+        instance.saved_status = instance.__dict__.get('status')
+        return instance
+
+    def transition(self, status):
+        """Move to `status` with one conditional UPDATE; return the previous status, or None if not allowed."""
+        previous_status = self.TRANSITIONS.get(status)
+        if previous_status is None:
+            return None
+
+        now = timezone.now()
+        # Filtering on the expected status lets the database settle concurrent accept/reject requests
+        updated = Match.objects.filter(pk=self.pk, status=previous_status).update(status=status, updated_at=now)
+        if not updated:
+            return None
+        self.status = status
+        self.saved_status = status
+        self.updated_at = now
+        match_status_changed.send(sender=Match, instance=self, previous_status=previous_status)
+        return previous_status
+
 
 class Conversation(models.Model):
     # Each match has one conversation
     match = models.OneToOneField(Match, related_name="conversation", on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Snapshot of the latest message so the inbox does not have to read the messages table
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_message_preview = models.CharField(max_length=120, blank=True)
+    last_message_sender = models.ForeignKey(
+        User, related_name="+", null=True, blank=True, on_delete=models.SET_NULL
+    )
+    # Unread messages for each participant
+    requester_unread_count = models.PositiveIntegerField(default=0)
+    partner_unread_count = models.PositiveIntegerField(default=0)
+
+    PREVIEW_LENGTH = 120
 
     class Meta:
         ordering = ["-created_at"]
@@ -231,6 +315,18 @@ class Conversation(models.Model):
     def __str__(self):
         return f"Conversation for {self.match}"
 
+    @staticmethod
+    def unread_field(requester_id, user_id):
+        # Name of the counter that belongs to the given participant
+        return "requester_unread_count" if user_id == requester_id else "partner_unread_count"
+
+    def unread_count_for(self, user):
+        return getattr(self, self.unread_field(self.match.requester_id, user.pk))
+
+    @classmethod
+    def preview(cls, body):
+        return body if len(body) <= cls.PREVIEW_LENGTH else body[:cls.PREVIEW_LENGTH - 1] + "\u2026"
+
 
 class Message(models.Model):
     # Messages belong to a conversation and have a sender
@@ -242,6 +338,10 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # Backs the keyset pagination of a conversation's history
+            models.Index(fields=["conversation", "created_at", "id"], name="message_conv_created_idx"),
+        ]
 
     def __str__(self):
         return f"Message from {self.sender} at {self.created_at:%Y-%m-%d %H:%M}"
@@ -343,31 +443,57 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Backs the paginated feed and its unread-only filter
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_read_created_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user} ({self.verb})"
 
 
+# Block lists are cached per user and cleared by the Block signals
+BLOCK_CACHE_TIMEOUT = 60 * 10
+
+
+def _block_cache_key(user_id):
+    return f"skillswap:blocks:{user_id}"
+
+
+def block_sets(user):
+    """Return (ids this user blocked, ids that blocked this user) as cached frozensets."""
+    # Anonymous users do not have block relationships
+    if not user or not getattr(user, "is_authenticated", False):
+        return frozenset(), frozenset()
+
+    key = _block_cache_key(user.pk)
+    cached = cache.get(key)
+    if cached is None:
+        # Load both directions with one query
+        pairs = list(
+            Block.objects.filter(Q(blocker=user) | Q(blocked=user)).values_list("blocker_id", "blocked_id").order_by()
+        )
+        blocked_ids = frozenset(blocked_id for blocker_id, blocked_id in pairs if blocker_id == user.pk)
+        blocker_ids = frozenset(blocker_id for blocker_id, blocked_id in pairs if blocked_id == user.pk)
+        cached = (blocked_ids, blocker_ids)
+        cache.set(key, cached, BLOCK_CACHE_TIMEOUT)
+    return cached
+
+
+def invalidate_block_cache(*user_ids):
+    invalidate_now_and_on_commit([_block_cache_key(user_id) for user_id in user_ids])
+
+
 def is_blocked(user_a, user_b) -> bool:
     # Return False directly if one of the users is missing
     if not user_a or not user_b:
         return False
 
     # Check both directions: a blocks b or b blocks a
-    return Block.objects.filter(
-        Q(blocker=user_a, blocked=user_b) | Q(blocker=user_b, blocked=user_a)
-    ).exists()
+    return user_b.pk in blocked_user_ids(user_a)
 
 
 def blocked_user_ids(user):
-    # Anonymous users do not have block relationships
-    if not user or not getattr(user, "is_authenticated", False):
-        return []
-
-    # Users this person blocked
-    blocked_ids = Block.objects.filter(blocker=user).values_list("blocked_id", flat=True).order_by()
-    # Users who blocked this person
-    blocker_ids = Block.objects.filter(blocked=user).values_list("blocker_id", flat=True).order_by()
-
-    # Merge both querysets into one list of related blocked user ids
-    return list(blocked_ids.union(blocker_ids))
\ No newline at end of file
+    # Users this person blocked plus users who blocked this person
+    blocked_ids, blocker_ids = block_sets(user)
+    return blocked_ids | blocker_ids
@@ -0,0 +1,48 @@
+from collections import Counter
+
+from .counters import NOTIFICATIONS, adjust_unread
+from .models import Match, Notification
+
+
+def build_match_notifications(match, status, created):
+    """Build (without saving) the notifications for a new match or a match that moved to `status`.
+
+    `match` should come with request, requester and partner loaded so no lookups happen here.
+    """
+    title = match.request.title
+    if created:
+        # Notify the partner when a new match invite is sent
+        recipients = [(match.partner, match.requester, Notification.Verb.INVITE_SENT,
+                       f"{match.requester.username} sent you a match invite for '{title}'.")]
+    elif status == Match.Status.ACCEPTED:
+        recipients = [(match.requester, match.partner, Notification.Verb.INVITE_ACCEPTED,
+                       f"{match.partner.username} accepted your match invite for '{title}'.")]
+    elif status == Match.Status.REJECTED:
+        # Notify the requester if the invite is rejected
+        recipients = [(match.requester, match.partner, Notification.Verb.INVITE_REJECTED,
+                       f"{match.partner.username} declined your match invite for '{title}'.")]
+    elif status == Match.Status.COMPLETED:
+        # Notify both users when the match is marked as completed
+        recipients = [
+            (user, None, Notification.Verb.MATCH_COMPLETED, f"The match for '{title}' has been marked completed.")
+            for user in (match.requester, match.partner)
+        ]
+    else:
+        recipients = []
+
+    return [
+        Notification(user=user, actor=actor, match=match, request=match.request, verb=verb, message=message)
+        for user, actor, verb, message in recipients
+    ]
+
+
+def create_notifications(notifications):
+    """Insert notifications with one bulk_create and apply the counter updates their signals would have made."""
+    if not notifications:
+        return []
+    created = Notification.objects.bulk_create(notifications)
+    # bulk_create does not send post_save, so bump the unread counters here (one update per user)
+    unread = Counter(notification.user_id for notification in created if not notification.is_read)
+    for user_id, count in unread.items():
+        adjust_unread(user_id, NOTIFICATIONS, count)
+    return created
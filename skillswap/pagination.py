@@ -0,0 +1,209 @@
+import base64
+import binascii
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def encode_cursor(values):
+    """Turn the ordering values of a row into an opaque URL-safe token."""
+    # isoformat keeps microseconds, which the keyset comparison needs
+    raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, model, ordering):
+    """Read a token made by encode_cursor back into typed values, or return None if it is invalid."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(raw, list) or len(raw) != len(ordering):
+            return None
+        return tuple(
+            model._meta.get_field(field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, raw)
+        )
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, FieldDoesNotExist, ValidationError):
+        return None
+
+
+def keyset_filter(ordering, values):
+    """Filter for rows that come after `values` in the given ordering, e.g. ('-created_at', '-id')."""
+    # (a, b) after (x, y) means a past x, or a equal to x and b past y
+    condition = None
+    for index, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[index]})
+        for previous, value in zip(ordering[:index], values[:index]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition = step if condition is None else condition | step
+    return condition
+
+
+class KeysetPage:
+    # One page of rows plus the cursors for the pages around it (None where there is no such page)
+    def __init__(self, items, next_cursor, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=20, backwards=False):
+    """Return a KeysetPage of `queryset` ordered by `ordering`, starting after the decoded `cursor`.
+
+    With `backwards`, the page is the one that ends just before `cursor`, still in `ordering` order.
+    """
+    direction = reverse_ordering(ordering) if backwards else ordering
+    queryset = queryset.order_by(*direction)
+    if cursor is not None:
+        queryset = queryset.filter(keyset_filter(direction, cursor))
+
+    # Fetch one extra row to learn whether another page exists without a COUNT
+    items = list(queryset[:per_page + 1])
+    more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+
+    def cursor_of(item):
+        return encode_cursor([getattr(item, field.lstrip('-')) for field in ordering])
+
+    # The extra row shows a page beyond this one; having come from a cursor shows one on the other side
+    has_later = cursor is not None if backwards else more
+    has_earlier = more if backwards else cursor is not None
+    next_cursor = cursor_of(items[-1]) if items and has_later else None
+    previous_cursor = cursor_of(items[0]) if items and has_earlier else None
+    return KeysetPage(items, next_cursor, previous_cursor)
+
+
+def estimated_count(queryset):
+    """The PostgreSQL planner's row estimate for `queryset`, read from EXPLAIN without running it."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CachedCountPage(Page):
+    """Page that knows from one extra fetched row whether another page follows, for when the count is a guess."""
+
+    def __init__(self, object_list, number, paginator, has_next=None):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        if self._has_next is None:
+            return super().has_next()
+        return self._has_next
+
+    def end_index(self):
+        if self._has_next is None:
+            return super().end_index()
+        return self.start_index() + len(self) - 1
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that caches its count under `count_key` and stops counting at `count_limit` rows.
+
+    Past the limit the count becomes the planner estimate on PostgreSQL, or the limit itself elsewhere, and
+    `count_is_exact` is False so templates can show "about N" or "1000+". Pages then no longer end at that
+    count: any page with rows can be opened, and Next appears while a row past the current page exists.
+    """
+
+    count_limit = 1000
+    count_timeout = 60
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page, **kwargs)
+        self.count_key = count_key
+        self.count_is_exact = True
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        if self.count_key:
+            cached = cache.get(self.count_key)
+            if cached is not None:
+                count, self.count_is_exact = cached
+                return count
+
+        count = self._bounded_count()
+        if self.count_key:
+            cache.set(self.count_key, (count, self.count_is_exact), self.count_timeout)
+        return count
+
+    def _has_exact_count(self):
+        self.count  # reading the count is what settles count_is_exact
+        return self.count_is_exact
+
+    def validate_number(self, number):
+        if self._has_exact_count():
+            return super().validate_number(number)
+        # The count is only a bound, so whether the page has rows is left to page()
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        if self._has_exact_count():
+            return super().page(number)
+        number = self.validate_number(number)
+        # One row past the page tells whether there is a next one
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        return CachedCountPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+    def _bounded_count(self):
+        # COUNT over a LIMIT subquery reads at most count_limit + 1 rows however broad the filter is
+        queryset = self.object_list.order_by()
+        count = queryset[:self.count_limit + 1].count()
+        if count <= self.count_limit:
+            return count
+
+        self.count_is_exact = False
+        if connections[queryset.db].vendor == 'postgresql':
+            return max(estimated_count(queryset), count)
+        return self.count_limit
+
+    @property
+    def count_label(self):
+        if self.count_is_exact:
+            return str(self.count)
+        if self.count > self.count_limit:
+            return f'about {self.count}'
+        return f'{self.count_limit}+'
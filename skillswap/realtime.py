@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from .models import Message
+
+# Most messages a listener receives in one batch when catching up from the database
+CATCH_UP_LIMIT = 100
+
+_broker_lock = threading.Lock()
+_broker = None
+
+
+def message_payload(message):
+    """JSON-ready representation of a message sent to live clients."""
+    return {
+        'id': message.pk,
+        'sender_id': message.sender_id,
+        'sender': message.sender.username,
+        'body': message.body,
+        'created_at': message.created_at.isoformat(),
+        'report_url': reverse('skillswap:report-message', args=[message.pk]),
+    }
+
+
+async def messages_after(conversation_id, after_id, limit=CATCH_UP_LIMIT):
+    # Messages newer than after_id, read with the async ORM
+    queryset = (
+        Message.objects.filter(conversation_id=conversation_id, id__gt=after_id)
+        .select_related('sender')
+        .order_by('id')[:limit]
+    )
+    return [message_payload(message) async for message in queryset]
+
+
+class InProcessBroker:
+    """Pub/sub inside one worker process: inbox_send publishes, open streams in the same worker listen."""
+
+    # A listener yields an empty batch after this many idle seconds so the stream can send a heartbeat
+    idle_timeout = 15
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = defaultdict(set)
+
+    def publish_message(self, message):
+        # Called from sync code, so hand the payload to each listener's own event loop
+        payload = message_payload(message)
+        with self._lock:
+            listeners = list(self._listeners.get(message.conversation_id, ()))
+        for loop, queue in listeners:
+            loop.call_soon_threadsafe(queue.put_nowait, payload)
+
+    async def listen(self, conversation_id, after_id):
+        """Yield batches of message payloads with ids above after_id, or [] when idle."""
+        queue = asyncio.Queue()
+        listener = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._listeners[conversation_id].add(listener)
+        try:
+            # Catch up from the database after subscribing so nothing sent in between is lost
+            backlog = await messages_after(conversation_id, after_id)
+            if backlog:
+                after_id = backlog[-1]['id']
+                yield backlog
+
+            while True:
+                try:
+                    payloads = [await asyncio.wait_for(queue.get(), self.idle_timeout)]
+                except TimeoutError:
+                    yield []
+                    continue
+                while not queue.empty():
+                    payloads.append(queue.get_nowait())
+                batch = [payload for payload in payloads if payload['id'] > after_id]
+                if batch:
+                    after_id = batch[-1]['id']
+                    yield batch
+        finally:
+            with self._lock:
+                self._listeners[conversation_id].discard(listener)
+                if not self._listeners[conversation_id]:
+                    del self._listeners[conversation_id]
+
+
+class DatabasePollingBroker:
+    """Stand-in for a shared broker when several workers run: listeners poll the messages table."""
+
+    def __init__(self):
+        self.poll_interval = settings.SKILLSWAP_REALTIME_POLL_INTERVAL
+
+    def publish_message(self, message):
+        # The saved row is what listeners read, so there is nothing to send
+        pass
+
+    async def listen(self, conversation_id, after_id):
+        """Yield batches of message payloads with ids above after_id, or [] after an empty poll."""
+        while True:
+            batch = await messages_after(conversation_id, after_id)
+            if batch:
+                after_id = batch[-1]['id']
+                yield batch
+                continue
+            yield []
+            await asyncio.sleep(self.poll_interval)
+
+
+def get_broker():
+    """Return this worker's broker, built from SKILLSWAP_REALTIME_BROKER on first use."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.SKILLSWAP_REALTIME_BROKER)()
+    return _broker
@@ -0,0 +1,251 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Count, Prefetch, prefetch_related_objects
+
+from .caching import VersionedWorkerCache
+from .models import PartnerRecommendation, Profile, UserSkill
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the optional matrix backend
+    np = None
+
+User = get_user_model()
+
+
+def _skill_ids(user_id, skill_type):
+    # Skill ids one user has recorded with the given type
+    return set(
+        UserSkill.objects.filter(user_id=user_id, type=skill_type).values_list('skill_id', flat=True)
+    )
+
+
+def _count_by_user(skill_type, skill_ids, user_ids=None):
+    # Count matching distinct skills for each user in one grouped query
+    if not skill_ids:
+        return {}
+    rows = UserSkill.objects.filter(type=skill_type, skill_id__in=skill_ids)
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    rows = rows.values('user_id').annotate(total=Count('skill_id', distinct=True)).order_by()
+    return {row['user_id']: row['total'] for row in rows}
+
+
+def _build_row(user_id, candidate_id, overlap, mutual):
+    return PartnerRecommendation(
+        user_id=user_id,
+        candidate_id=candidate_id,
+        overlap_want_offer=overlap,
+        mutual_overlap=mutual,
+        final_score=overlap + mutual,
+    )
+
+
+def refresh_recommendations_for(user_id):
+    """Recompute every stored recommendation row where `user_id` is the learner."""
+    want_ids = _skill_ids(user_id, UserSkill.SkillType.WANT)
+    offer_ids = _skill_ids(user_id, UserSkill.SkillType.OFFER)
+
+    # Candidates must offer at least one skill the user wants
+    overlap = _count_by_user(UserSkill.SkillType.OFFER, want_ids)
+    overlap.pop(user_id, None)
+    mutual = _count_by_user(UserSkill.SkillType.WANT, offer_ids, user_ids=list(overlap))
+
+    rows = [
+        _build_row(user_id, candidate_id, count, mutual.get(candidate_id, 0))
+        for candidate_id, count in overlap.items()
+    ]
+    with transaction.atomic():
+        PartnerRecommendation.objects.filter(user_id=user_id).delete()
+        PartnerRecommendation.objects.bulk_create(rows)
+
+
+def refresh_recommendations_towards(candidate_id, user_ids):
+    """Recompute the rows that point at `candidate_id` for the given learners."""
+    user_ids = [user_id for user_id in set(user_ids) if user_id != candidate_id]
+    if not user_ids:
+        return
+
+    offer_ids = _skill_ids(candidate_id, UserSkill.SkillType.OFFER)
+    want_ids = _skill_ids(candidate_id, UserSkill.SkillType.WANT)
+
+    # Learners who want something the candidate offers, and the reverse direction
+    overlap = _count_by_user(UserSkill.SkillType.WANT, offer_ids, user_ids=user_ids)
+    mutual = _count_by_user(UserSkill.SkillType.OFFER, want_ids, user_ids=list(overlap))
+
+    rows = [
+        _build_row(user_id, candidate_id, count, mutual.get(user_id, 0))
+        for user_id, count in overlap.items()
+    ]
+    with transaction.atomic():
+        PartnerRecommendation.objects.filter(user_id__in=user_ids, candidate_id=candidate_id).delete()
+        PartnerRecommendation.objects.bulk_create(rows)
+
+
+def sync_user_skill(user_id, skill_id, skill_type):
+    """Bring the stored recommendations up to date after one of `user_id`'s UserSkill rows changed."""
+    refresh_recommendations_for(user_id)
+
+    # Learners whose row for this user may now be stale (covers edits that changed skill or type)
+    affected = set(PartnerRecommendation.objects.filter(candidate_id=user_id).values_list('user_id', flat=True))
+
+    # Learners who could gain a row because of this skill
+    if skill_type == UserSkill.SkillType.OFFER:
+        complementary_type = UserSkill.SkillType.WANT
+    else:
+        complementary_type = UserSkill.SkillType.OFFER
+    affected.update(
+        UserSkill.objects.filter(skill_id=skill_id, type=complementary_type)
+        .values_list('user_id', flat=True)
+    )
+    refresh_recommendations_towards(user_id, affected)
+
+
+SKILL_MATRIX_VERSION_KEY = 'skillswap:skill-matrix-version'
+
+
+class SkillMatrix:
+    """In-memory copy of the offer/want relation stored as sparse (user, skill) coordinate arrays."""
+
+    def __init__(self, version):
+        self.version = version
+
+        # Rows are kept in id order so the row index doubles as the final tie-breaker
+        users = list(User.objects.order_by('id').values_list('id', 'profile__preferred_mode'))
+        self.user_ids = np.array([user_id for user_id, _ in users], dtype=np.int64)
+        self.user_index = {user_id: index for index, (user_id, _) in enumerate(users)}
+        mode_codes = {mode: code for code, mode in enumerate(Profile.PreferredMode.values)}
+        self.mode_codes = mode_codes
+        self.modes = np.array([mode_codes.get(mode, -1) for _, mode in users], dtype=np.int8)
+
+        entries = list(UserSkill.objects.values_list('user_id', 'skill_id', 'type').order_by())
+        skill_ids = sorted({skill_id for _, skill_id, _ in entries})
+        self.skill_ids = np.array(skill_ids, dtype=np.int64)
+        self.skill_index = {skill_id: index for index, skill_id in enumerate(skill_ids)}
+        self.skill_count = len(skill_ids)
+
+        self.offer_users, self.offer_skills = self._coordinates(entries, UserSkill.SkillType.OFFER)
+        self.want_users, self.want_skills = self._coordinates(entries, UserSkill.SkillType.WANT)
+
+    def _coordinates(self, entries, skill_type):
+        pairs = [
+            (self.user_index[user_id], self.skill_index[skill_id])
+            for user_id, skill_id, entry_type in entries
+            if entry_type == skill_type and user_id in self.user_index
+        ]
+        if not pairs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        coordinates = np.array(pairs, dtype=np.int64)
+        return coordinates[:, 0], coordinates[:, 1]
+
+    def _skill_vector(self, skill_ids):
+        vector = np.zeros(self.skill_count, dtype=bool)
+        columns = [self.skill_index[skill_id] for skill_id in skill_ids if skill_id in self.skill_index]
+        vector[columns] = True
+        return vector
+
+    def skills_of(self, user_id, skill_type):
+        row = self.user_index.get(user_id)
+        if row is None:
+            return []
+        if skill_type == UserSkill.SkillType.OFFER:
+            users, skills = self.offer_users, self.offer_skills
+        else:
+            users, skills = self.want_users, self.want_skills
+        return self.skill_ids[skills[users == row]].tolist()
+
+    def score(self, user_id, want_skill_ids, offer_skill_ids, mode=None, exclude_ids=(), limit=None):
+        """Return (candidate_id, overlap_want_offer, mutual_overlap) tuples in recommendation order."""
+        user_count = len(self.user_ids)
+        if not user_count or not want_skill_ids:
+            return []
+
+        # Sparse matrix-vector products: count each user's offers that hit our wants, and vice versa
+        wanted = self._skill_vector(want_skill_ids)
+        offered = self._skill_vector(offer_skill_ids)
+        overlap = np.bincount(self.offer_users[wanted[self.offer_skills]], minlength=user_count)
+        mutual = np.bincount(self.want_users[offered[self.want_skills]], minlength=user_count)
+
+        # Filters are applied as masks over all users
+        mask = overlap > 0
+        excluded = [self.user_index[pk] for pk in (user_id, *exclude_ids) if pk in self.user_index]
+        mask[excluded] = False
+        if mode is not None:
+            mask &= self.modes == self.mode_codes.get(mode, -2)
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+
+        # One integer key encodes the ordering -final_score, -overlap_want_offer, id
+        final_score = overlap[candidates] + mutual[candidates]
+        key = (final_score * (int(overlap.max()) + 1) + overlap[candidates]) * user_count
+        key += user_count - 1 - candidates
+        if limit and len(candidates) > limit:
+            top = np.argpartition(-key, limit - 1)[:limit]
+            candidates, key = candidates[top], key[top]
+        ordered = candidates[np.argsort(-key)]
+        return [
+            (int(self.user_ids[row]), int(overlap[row]), int(mutual[row]))
+            for row in ordered
+        ]
+
+
+_skill_matrix = VersionedWorkerCache(SKILL_MATRIX_VERSION_KEY, SkillMatrix)
+
+
+def bump_skill_matrix_version():
+    _skill_matrix.bump()
+
+
+def get_skill_matrix():
+    """Return this worker's SkillMatrix, rebuilding it when the shared version key has moved."""
+    if np is None:
+        raise ImproperlyConfigured('The matrix recommendation backend requires numpy.')
+    return _skill_matrix.get()
+
+
+def matrix_recommended_partners(user, q=None, mode=None, limit=None, exclude_ids=()):
+    """Drop-in for the SQL recommendation query that scores candidates in memory."""
+    matrix = get_skill_matrix()
+    if q:
+        want_skill_ids = list(
+            UserSkill.objects.filter(
+                user=user,
+                type=UserSkill.SkillType.WANT,
+                skill__name__icontains=q,
+            ).values_list('skill_id', flat=True)
+        )
+    else:
+        want_skill_ids = matrix.skills_of(user.pk, UserSkill.SkillType.WANT)
+    offer_skill_ids = matrix.skills_of(user.pk, UserSkill.SkillType.OFFER)
+
+    if mode not in Profile.PreferredMode.values:
+        mode = None
+    scored = matrix.score(user.pk, want_skill_ids, offer_skill_ids, mode=mode, exclude_ids=exclude_ids,
+                          limit=limit)
+
+    # Load the user objects for the winners only, keeping the computed order
+    users = User.objects.select_related('profile').in_bulk([candidate_id for candidate_id, _, _ in scored])
+    partners = []
+    for candidate_id, overlap, mutual in scored:
+        partner = users.get(candidate_id)
+        if partner is None:
+            continue
+        partner.overlap_want_offer = overlap
+        partner.mutual_overlap = mutual
+        partner.final_score = overlap + mutual
+        partners.append(partner)
+
+    prefetch_related_objects(
+        partners,
+        Prefetch(
+            'user_skills',
+            queryset=UserSkill.objects.filter(
+                type=UserSkill.SkillType.OFFER,
+                skill_id__in=want_skill_ids,
+            ).select_related('skill'),
+            to_attr='matching_offers',
+        ),
+    )
+    return partners
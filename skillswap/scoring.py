@@ -0,0 +1,56 @@
+"""Plain-Python partner scoring shared by the batch rebuild command and its worker processes.
+
+Nothing here imports Django, so worker processes can score users without setting up the app registry.
+"""
+
+_skill_maps = None
+
+
+def build_skill_maps(entries):
+    """Group (user_id, skill_id, type) rows into want/offer sets plus an offer lookup by skill."""
+    wants, offers, offered_by = {}, {}, {}
+    for user_id, skill_id, skill_type in entries:
+        if skill_type == 'want':
+            wants.setdefault(user_id, set()).add(skill_id)
+        else:
+            offers.setdefault(user_id, set()).add(skill_id)
+            offered_by.setdefault(skill_id, set()).add(user_id)
+    return wants, offers, offered_by
+
+
+def score_user(user_id, wants, offers, offered_by):
+    """Return (user_id, candidate_id, overlap_want_offer, mutual_overlap) rows for one learner."""
+    want_ids = wants.get(user_id)
+    if not want_ids:
+        return []
+    offer_ids = offers.get(user_id, set())
+
+    candidates = set()
+    for skill_id in want_ids:
+        candidates.update(offered_by.get(skill_id, ()))
+    candidates.discard(user_id)
+
+    return [
+        (
+            user_id,
+            candidate_id,
+            len(want_ids & offers[candidate_id]),
+            len(offer_ids & wants.get(candidate_id, set())),
+        )
+        for candidate_id in candidates
+    ]
+
+
+def init_worker(skill_maps):
+    # Each worker receives the skill maps once instead of once per chunk
+    global _skill_maps
+    _skill_maps = skill_maps
+
+
+def score_chunk(user_ids):
+    """Score a chunk of learners using the maps installed by init_worker."""
+    wants, offers, offered_by = _skill_maps
+    rows = []
+    for user_id in user_ids:
+        rows.extend(score_user(user_id, wants, offers, offered_by))
+    return user_ids, rows
@@ -0,0 +1,127 @@
+import re
+
+from django.db import connection, transaction
+
+from .models import Request, Skill
+
+SEARCH_TABLE = 'skillswap_request_search'
+
+# Most ranked matches a search returns; the explore page paginates within them
+RESULT_LIMIT = 200
+
+# Letters and digits only, so user input can never change the structure of the full-text query
+TERM_PATTERN = re.compile(r'[^\W_]+')
+MAX_TERMS = 8
+
+# The index is a standalone table keyed by request id, created by migration 0013: an FTS5 virtual table on SQLite,
+# a weighted tsvector with a GIN index on PostgreSQL
+KEY_COLUMN = {'sqlite': 'rowid', 'postgresql': 'request_id'}
+
+# Copy open requests matching a condition on `r` into the index. The 'simple' configuration does not stem,
+# which keeps prefix matches predictable and the same as the FTS5 tokenizer
+INSERT_SQL = {
+    'sqlite': (
+        f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, skill_name) '
+        'SELECT r.id, r.title, r.description, s.name'
+    ),
+    'postgresql': (
+        f'INSERT INTO {SEARCH_TABLE} (request_id, document) '
+        "SELECT r.id, setweight(to_tsvector('simple', r.title), 'A') "
+        "|| setweight(to_tsvector('simple', s.name), 'B') "
+        "|| setweight(to_tsvector('simple', r.description), 'C')"
+    ),
+}
+SOURCE_SQL = (
+    f' FROM {Request._meta.db_table} r JOIN {Skill._meta.db_table} s ON s.id = r.skill_id'
+    ' WHERE r.status = %s AND '
+)
+
+# Ranked lookups; bm25 weights title, description, skill name (lower scores are better).
+# {condition} narrows the matches before the LIMIT
+SEARCH_SQL = {
+    'sqlite': (
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s{{condition}} '
+        f'ORDER BY bm25({SEARCH_TABLE}, 10.0, 1.0, 5.0) LIMIT %s'
+    ),
+    'postgresql': (
+        f"SELECT request_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+        'WHERE document @@ query{condition} ORDER BY ts_rank(document, query) DESC, request_id DESC LIMIT %s'
+    ),
+}
+
+_available = {}
+
+
+def is_available():
+    # Looked up once per process; the table only appears or disappears through migrations, run beforehand
+    if connection.alias not in _available:
+        _available[connection.alias] = (
+            connection.vendor in KEY_COLUMN
+            and SEARCH_TABLE in connection.introspection.table_names()
+        )
+    return _available[connection.alias]
+
+
+def refresh(condition, params):
+    """Re-index the requests matching an SQL condition on `r`; closed requests only leave the index."""
+    key = KEY_COLUMN[connection.vendor]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE {key} IN (SELECT r.id FROM {Request._meta.db_table} r WHERE {condition})',
+            params,
+        )
+        cursor.execute(INSERT_SQL[connection.vendor] + SOURCE_SQL + condition, [Request.Status.OPEN, *params])
+        return cursor.rowcount
+
+
+def index_request(request_id):
+    if is_available():
+        refresh('r.id = %s', [request_id])
+
+
+def index_skill_requests(skill_id):
+    # Skill names are part of every document, so a rename touches all of that skill's requests
+    if is_available():
+        refresh('r.skill_id = %s', [skill_id])
+
+
+def remove_request(request_id):
+    if is_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {KEY_COLUMN[connection.vendor]} = %s', [request_id])
+
+
+def rebuild_index():
+    """Empty the index and fill it again from every open request, returning the number indexed."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(INSERT_SQL[connection.vendor] + SOURCE_SQL + '1 = 1', [Request.Status.OPEN])
+        return cursor.rowcount
+
+
+def search_terms(query):
+    return TERM_PATTERN.findall(query.lower())[:MAX_TERMS]
+
+
+def search_request_ids(query, limit=RESULT_LIMIT, within=None):
+    """Ids of open requests matching every word of `query` as a prefix, best match first.
+
+    `within` is an optional Request queryset the matches must belong to; it is applied in the same SQL so
+    the limit counts only requests the caller can show. Returns None when the database has no search index
+    or the query has no words, so callers can fall back to a plain filter.
+    """
+    terms = search_terms(query)
+    if not terms or not is_available():
+        return None
+    if connection.vendor == 'sqlite':
+        expression = ' '.join(f'"{term}"*' for term in terms)
+    else:
+        expression = ' & '.join(f'{term}:*' for term in terms)
+    condition, condition_params = '', ()
+    if within is not None:
+        subquery, condition_params = within.order_by().values('pk').query.sql_with_params()
+        condition = f' AND {KEY_COLUMN[connection.vendor]} IN ({subquery})'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SEARCH_SQL[connection.vendor].format(condition=condition), [expression, *condition_params, limit])
+        return [row[0] for row in cursor.fetchall()]
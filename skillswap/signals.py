@@ -1,8 +1,29 @@
+from functools import partial
+
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import Conversation, Match, Notification, Profile
+from .autocomplete import bump_skill_index_version
+from .counters import NOTIFICATIONS, adjust_unread, record_deleted_message, record_new_message
+from .models import (
+    Block,
+    Conversation,
+    Match,
+    Message,
+    Notification,
+    Profile,
+    Request,
+    Skill,
+    UserSkill,
+    invalidate_block_cache,
+    match_status_changed,
+)
+from .recommendations import bump_skill_matrix_version
+from .search import index_request, index_skill_requests, remove_request
+from .tasks import send_match_notifications, sync_recommendations
 
 User = get_user_model()
 
@@ -14,75 +35,131 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 
-# Save the old match status before the object is updated
-@receiver(pre_save, sender=Match)
-def capture_match_status(sender, instance, **kwargs):
-    if instance.pk:
-        instance._previous_status = (
-            Match.objects.filter(pk=instance.pk)
-            .values_list("status", flat=True)
-            .first()
-        )
-    else:
-        instance._previous_status = None
-
-
-# Send notifications when a match is created or its status changes
+# Send the invite notification when a match is created
 @receiver(post_save, sender=Match)
-def notify_match_updates(sender, instance, created, **kwargs):
-    if created:
-        # Notify the partner when a new match invite is sent
-        Notification.objects.create(
-            user=instance.partner,
-            actor=instance.requester,
-            match=instance,
-            request=instance.request,
-            verb=Notification.Verb.INVITE_SENT,
-            message=f"{instance.requester.username} sent you a match invite for '{instance.request.title}'.",
-        )
+def notify_match_updates(sender, instance, created, update_fields=None, **kwargs):
+    if not created:
+        if update_fields is not None and 'status' not in update_fields:
+            return
+        # A save() that changed the status (for example in the admin) has the same effects as transition().
+        # Instances not loaded from the database carry no saved_status and are left alone
+        previous_status = getattr(instance, 'saved_status', None)
+        instance.saved_status = instance.status
+        if previous_status is not None and previous_status != instance.status:
+            notify_match_transition(sender, instance, previous_status=previous_status)
         return
+    instance.saved_status = instance.status
+    if instance.status in (Match.Status.ACCEPTED, Match.Status.COMPLETED):
+        # Every match that can chat has a conversation, so the inbox never has to create one
+        Conversation.objects.get_or_create(match=instance)
 
-    previous_status = getattr(instance, "_previous_status", None)
-    # Skip if there is no previous status or the status did not change
-    if previous_status is None or previous_status == instance.status:
-        return
+    # The notification fan-out runs as a task once the match is committed
+    transaction.on_commit(partial(send_match_notifications.enqueue, instance.pk, instance.status, True))
 
-    if instance.status == Match.Status.ACCEPTED:
-        # Create a conversation after the match is accepted
+
+# Status changes go through Match.transition(), which reports the previous status without a pre-read
+@receiver(match_status_changed, sender=Match)
+def notify_match_transition(sender, instance, previous_status, **kwargs):
+    if instance.status in (Match.Status.ACCEPTED, Match.Status.COMPLETED):
         Conversation.objects.get_or_create(match=instance)
-        Notification.objects.create(
-            user=instance.requester,
-            actor=instance.partner,
-            match=instance,
-            request=instance.request,
-            verb=Notification.Verb.INVITE_ACCEPTED,
-            message=f"{instance.partner.username} accepted your match invite for '{instance.request.title}'.",
-        )
-    elif instance.status == Match.Status.REJECTED:
-        # Notify the requester if the invite is rejected
-        Notification.objects.create(
-            user=instance.requester,
-            actor=instance.partner,
-            match=instance,
-            request=instance.request,
-            verb=Notification.Verb.INVITE_REJECTED,
-            message=f"{instance.partner.username} declined your match invite for '{instance.request.title}'.",
-        )
-    elif instance.status == Match.Status.COMPLETED:
-        # Notify both users when the match is marked as completed
-        Notification.objects.create(
-            user=instance.requester,
-            actor=None,
-            match=instance,
-            request=instance.request,
-            verb=Notification.Verb.MATCH_COMPLETED,
-            message=f"The match for '{instance.request.title}' has been marked completed.",
-        )
-        Notification.objects.create(
-            user=instance.partner,
-            actor=None,
-            match=instance,
-            request=instance.request,
-            verb=Notification.Verb.MATCH_COMPLETED,
-            message=f"The match for '{instance.request.title}' has been marked completed.",
-        )
\ No newline at end of file
+    transaction.on_commit(partial(send_match_notifications.enqueue, instance.pk, instance.status, False))
+
+
+def _sync_recommendations_after_commit(user_skill):
+    # The refresh runs as a task once the skill change is committed, so the user's request does not wait for it
+    transaction.on_commit(partial(
+        sync_recommendations.enqueue, user_skill.user_id, user_skill.skill_id, user_skill.type))
+
+
+# Keep the precomputed partner recommendations in step with skill changes. Matrix version bumps wait for the
+# commit too, or another worker could rebuild from rows that are not visible yet and keep that copy
+@receiver(post_save, sender=UserSkill)
+def refresh_recommendations_on_save(sender, instance, **kwargs):
+    _sync_recommendations_after_commit(instance)
+    transaction.on_commit(bump_skill_matrix_version)
+
+
+@receiver(post_delete, sender=UserSkill)
+def refresh_recommendations_on_delete(sender, instance, origin=None, **kwargs):
+    # When the whole user is being deleted their recommendation rows cascade away anyway
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    transaction.on_commit(bump_skill_matrix_version)
+    if origin_model is User:
+        return
+    _sync_recommendations_after_commit(instance)
+
+
+# The in-memory skill matrix has a row, with the preferred mode, for every user
+@receiver(post_save, sender=User)
+def invalidate_skill_matrix_on_user_save(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(bump_skill_matrix_version)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_skill_matrix_on_user_delete(sender, instance, **kwargs):
+    transaction.on_commit(bump_skill_matrix_version)
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_skill_matrix_on_profile_save(sender, instance, update_fields=None, **kwargs):
+    # Activity tracking saves only last_active/last_path, which the matrix does not use
+    if update_fields is None or 'preferred_mode' in update_fields:
+        transaction.on_commit(bump_skill_matrix_version)
+
+
+# Clear cached block lists for both users whenever a block is added or removed
+@receiver(post_save, sender=Block)
+@receiver(post_delete, sender=Block)
+def invalidate_block_lists(sender, instance, **kwargs):
+    invalidate_block_cache(instance.blocker_id, instance.blocked_id)
+
+
+# Keep the unread counters on Profile in step with new and deleted rows
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        adjust_unread(instance.user_id, NOTIFICATIONS, 1)
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        adjust_unread(instance.user_id, NOTIFICATIONS, -1)
+
+
+# Messages also keep the conversation's last-message snapshot and per-participant counts current
+@receiver(post_save, sender=Message)
+def count_new_message(sender, instance, created, **kwargs):
+    if created:
+        record_new_message(instance)
+
+
+@receiver(post_delete, sender=Message)
+def uncount_deleted_message(sender, instance, **kwargs):
+    record_deleted_message(instance)
+
+
+# Keep the full-text search index in step with requests and the skill names stored in it
+@receiver(post_save, sender=Request)
+def index_saved_request(sender, instance, **kwargs):
+    index_request(instance.pk)
+
+
+@receiver(post_delete, sender=Request)
+def unindex_deleted_request(sender, instance, **kwargs):
+    remove_request(instance.pk)
+
+
+@receiver(post_save, sender=Skill)
+def reindex_skill_requests(sender, instance, created, **kwargs):
+    if not created:
+        index_skill_requests(instance.pk)
+
+
+# Workers rebuild their skill autocomplete index when a skill is added, renamed or removed
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+def invalidate_skill_index(sender, **kwargs):
+    # After commit, so no worker rebuilds from the rows this transaction has not published yet
+    transaction.on_commit(bump_skill_index_version)
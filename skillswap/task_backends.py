@@ -0,0 +1,50 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from django.tasks.backends.immediate import ImmediateBackend
+from django.tasks.base import TaskResultStatus
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundThreadBackend(ImmediateBackend):
+    """Run tasks on a small thread pool inside the web worker, so callers return before the task finishes.
+
+    Results are kept in memory only: tasks still queued when the process stops are lost, and failures are only
+    visible in the log. Use a database-backed backend (for example the django-tasks package) when tasks must
+    survive restarts.
+
+    ImmediateBackend.enqueue builds the TaskResult and hands it to _execute_task; only that step is moved to
+    the pool. The hook is not public API, so requirements.txt pins Django, and if a Django version no longer
+    has it this backend says so at startup and tasks run immediately instead.
+    """
+
+    def __init__(self, alias, params):
+        super().__init__(alias, params)
+        if not callable(getattr(ImmediateBackend, '_execute_task', None)):
+            logger.warning(
+                'ImmediateBackend._execute_task is missing in this Django version; '
+                'tasks on the %r backend will run immediately.', alias,
+            )
+        max_workers = params.get('OPTIONS', {}).get('max_workers', 2)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'tasks-{alias}')
+
+    def _execute_task(self, task_result):
+        self._executor.submit(self._run, task_result)
+
+    def _run(self, task_result):
+        try:
+            super()._execute_task(task_result)
+        except Exception:
+            logger.exception('Task %s (%s) crashed.', task_result.task.name, task_result.id)
+        else:
+            # ImmediateBackend stores failures on the result, which nobody reads for a background task
+            if task_result.status == TaskResultStatus.FAILED:
+                logger.error(
+                    'Task %s (%s) failed:\n%s', task_result.task.name, task_result.id,
+                    task_result.errors[-1].traceback,
+                )
+        finally:
+            # Pool threads open their own database connections, so close them after each task
+            connections.close_all()
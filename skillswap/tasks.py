@@ -0,0 +1,22 @@
+from django.tasks import task
+
+from .models import Match
+from .notifications import build_match_notifications, create_notifications
+from .recommendations import sync_user_skill
+
+
+@task
+def send_match_notifications(match_id, status, created):
+    """Create the notifications for a new match or for a match that moved to `status`."""
+    # Everything the messages mention is loaded in this one query
+    match = Match.objects.select_related('request', 'requester', 'partner').filter(pk=match_id).first()
+    # The match may have been deleted before the task ran
+    if match is None:
+        return 0
+    return len(create_notifications(build_match_notifications(match, status, created)))
+
+
+@task
+def sync_recommendations(user_id, skill_id, skill_type):
+    """Refresh the stored recommendations after one of `user_id`'s skills was saved or deleted."""
+    sync_user_skill(user_id, skill_id, skill_type)
@@ -1,18 +1,58 @@
+import asyncio
+import threading
+import time
+from contextlib import aclosing
+from datetime import timedelta
+from io import StringIO
+from unittest import skipIf
+
+from asgiref.sync import iscoroutinefunction
+
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from django.db import IntegrityError
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection
+from django.tasks import TaskResultStatus, task
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from django.utils import timezone
 
-from .models import Block, Conversation, Feedback, Match, Message, Notification, Report, Request, Skill, UserSkill
+from . import recommendations, search
+from .activity import ActivityBuffer, activity_buffer
+from .autocomplete import get_skill_index
+from .counters import _unread_cache_key, unread_counts
+from .forms import UserSkillForm
+from .middleware import ActivityMiddleware
+from .models import Block, Conversation, Feedback, Match, Message, Notification, PartnerRecommendation, Profile, Report, \
+    Request, Skill, UserSkill, _block_cache_key, blocked_user_ids, is_blocked
+from .pagination import CachedCountPaginator, encode_cursor
+from .realtime import InProcessBroker
+from .task_backends import BackgroundThreadBackend
+from .tasks import send_match_notifications
+from .views import MESSAGE_PAGE_SIZE, NOTIFICATION_PAGE_SIZE, get_recommended_partners
 
 User = get_user_model()
 
 
+@task
+def add_numbers(a, b):
+    # Used to exercise the task backend without touching the database
+    return a + b
+
+
+@task
+def divide_numbers(a, b):
+    # Fails when b is 0, to exercise task error logging
+    return a / b
+
+
 class SkillSwapTests(TestCase):
     def setUp(self):
+        # Cached per-user data would otherwise leak between tests that reuse the same ids
+        cache.clear()
         # Create some basic test data used in many test cases
         self.user = User.objects.create_user(username='alice', password='password123')
         self.other = User.objects.create_user(username='bob', password='password123')
@@ -121,16 +161,17 @@ class SkillSwapTests(TestCase):
         skill_two = Skill.objects.create(name='Django', category='programming')
         skill_three = Skill.objects.create(name='Data Analysis', category='other')
 
-        UserSkill.objects.create(user=self.user, skill=self.skill, type='want', level='beginner')
-        UserSkill.objects.create(user=self.user, skill=skill_two, type='want', level='beginner')
-
         charlie = User.objects.create_user(username='charlie', password='password123')
         dana = User.objects.create_user(username='dana', password='password123')
 
-        UserSkill.objects.create(user=self.other, skill=self.skill, type='offer', level='advanced')
-        UserSkill.objects.create(user=charlie, skill=self.skill, type='offer', level='advanced')
-        UserSkill.objects.create(user=charlie, skill=skill_two, type='offer', level='advanced')
-        UserSkill.objects.create(user=dana, skill=skill_three, type='offer', level='advanced')
+        # Stored recommendations are refreshed by a task after each skill change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            UserSkill.objects.create(user=self.user, skill=self.skill, type='want', level='beginner')
+            UserSkill.objects.create(user=self.user, skill=skill_two, type='want', level='beginner')
+            UserSkill.objects.create(user=self.other, skill=self.skill, type='offer', level='advanced')
+            UserSkill.objects.create(user=charlie, skill=self.skill, type='offer', level='advanced')
+            UserSkill.objects.create(user=charlie, skill=skill_two, type='offer', level='advanced')
+            UserSkill.objects.create(user=dana, skill=skill_three, type='offer', level='advanced')
 
         self.client.login(username='alice', password='password123')
         response = self.client.get(reverse('skillswap:recommendations'))
@@ -147,6 +188,138 @@ class SkillSwapTests(TestCase):
         self.assertEqual(recommendations[0], charlie)
         self.assertGreaterEqual(recommendations[0].final_score, recommendations[1].final_score)
 
+        # The stored scores come out of the score index already in order, ties included
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', get_recommended_partners(self.user, limit=12).explain())
+
+    def test_partner_recommendations_follow_skill_changes(self):
+        # Stored recommendation rows should be updated when skills are added, edited or removed
+        skill_two = Skill.objects.create(name='Django', category='programming')
+        with self.captureOnCommitCallbacks(execute=True):
+            UserSkill.objects.create(user=self.user, skill=self.skill, type='want', level='beginner')
+            UserSkill.objects.create(user=self.user, skill=skill_two, type='offer', level='advanced')
+            offer = UserSkill.objects.create(user=self.other, skill=self.skill, type='offer', level='advanced')
+
+        row = PartnerRecommendation.objects.get(user=self.user, candidate=self.other)
+        self.assertEqual((row.overlap_want_offer, row.mutual_overlap, row.final_score), (1, 0, 1))
+
+        # The partner also wants something the user offers; nothing changes until the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            UserSkill.objects.create(user=self.other, skill=skill_two, type='want', level='beginner')
+            row = PartnerRecommendation.objects.get(user=self.user, candidate=self.other)
+            self.assertEqual(row.final_score, 1)
+        row = PartnerRecommendation.objects.get(user=self.user, candidate=self.other)
+        self.assertEqual((row.overlap_want_offer, row.mutual_overlap, row.final_score), (1, 1, 2))
+
+        # Changing the offered skill removes the overlap
+        offer.skill = skill_two
+        with self.captureOnCommitCallbacks(execute=True):
+            offer.save()
+        self.assertFalse(PartnerRecommendation.objects.filter(user=self.user, candidate=self.other).exists())
+
+        offer.skill = self.skill
+        with self.captureOnCommitCallbacks(execute=True):
+            offer.save()
+        self.assertTrue(PartnerRecommendation.objects.filter(user=self.user, candidate=self.other).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            offer.delete()
+        self.assertFalse(PartnerRecommendation.objects.filter(user=self.user, candidate=self.other).exists())
+
+    def test_recommendations_keyword_uses_live_scores(self):
+        # A keyword limits which wanted skills count towards the score
+        skill_two = Skill.objects.create(name='Django', category='programming')
+        with self.captureOnCommitCallbacks(execute=True):
+            UserSkill.objects.create(user=self.user, skill=self.skill, type='want', level='beginner')
+            UserSkill.objects.create(user=self.user, skill=skill_two, type='want', level='beginner')
+            UserSkill.objects.create(user=self.other, skill=self.skill, type='offer', level='advanced')
+            UserSkill.objects.create(user=self.other, skill=skill_two, type='offer', level='advanced')
+
+        self.client.login(username='alice', password='password123')
+        response = self.client.get(reverse('skillswap:recommendations'))
+        self.assertEqual(response.context['recommendations'][0].final_score, 2)
+
+        response = self.client.get(reverse('skillswap:recommendations'), {'q': 'djan'})
+        recommendations = list(response.context['recommendations'])
+        self.assertEqual(recommendations, [self.other])
+        self.assertEqual(recommendations[0].final_score, 1)
+
+    @skipIf(recommendations.np is None, 'numpy is not installed')
+    def test_matrix_backend_matches_sql_ordering(self):
+        # The in-memory backend should return the same partners, scores and order as the database
+        skills = [Skill.objects.create(name=f'Skill {index}', category='other') for index in range(4)]
+        partners = [User.objects.create_user(username=name, password='password123') for name in 'dcbe']
+        with self.captureOnCommitCallbacks(execute=True):
+            for skill in skills[:3]:
+                UserSkill.objects.create(user=self.user, skill=skill, type='want', level='beginner')
+            UserSkill.objects.create(user=self.user, skill=skills[3], type='offer', level='advanced')
+            for partner, offered in zip(partners, [skills[:2], skills[:1], skills[:2], skills[1:3]]):
+                for skill in offered:
+                    UserSkill.objects.create(user=partner, skill=skill, type='offer', level='advanced')
+            UserSkill.objects.create(user=partners[1], skill=skills[3], type='want', level='beginner')
+        partners[2].profile.preferred_mode = 'online'
+        partners[2].profile.save()
+        Block.objects.create(blocker=partners[3], blocked=self.user)
+
+        def summary(results):
+            return [(partner.username, partner.final_score, partner.overlap_want_offer) for partner in results]
+
+        # Equal scores are ordered by user id, so "d" (created first) comes before "b"
+        self.assertEqual(summary(get_recommended_partners(self.user)), [('d', 2, 2), ('b', 2, 2), ('c', 2, 1)])
+        for options in [{}, {'limit': 2}, {'mode': 'online'}, {'q': 'skill 1'}]:
+            expected = summary(get_recommended_partners(self.user, **options))
+            with override_settings(SKILLSWAP_RECOMMENDATION_BACKEND='matrix'):
+                self.assertEqual(summary(get_recommended_partners(self.user, **options)), expected)
+
+        # Workers only see a new matrix version once the skill change has committed
+        version = recommendations.get_skill_matrix().version
+        with self.captureOnCommitCallbacks(execute=True):
+            UserSkill.objects.create(user=partners[3], skill=skills[0], type='offer', level='advanced')
+            self.assertEqual(recommendations.get_skill_matrix().version, version)
+        self.assertNotEqual(recommendations.get_skill_matrix().version, version)
+
+    def test_rebuild_recommendations_command(self):
+        # The batch rebuild should restore rows that match the signal-maintained ones
+        charlie = User.objects.create_user(username='charlie', password='password123')
+        skill_two = Skill.objects.create(name='Django', category='programming')
+        with self.captureOnCommitCallbacks(execute=True):
+            UserSkill.objects.create(user=self.user, skill=self.skill, type='want', level='beginner')
+            UserSkill.objects.create(user=self.user, skill=skill_two, type='offer', level='advanced')
+            UserSkill.objects.create(user=self.other, skill=self.skill, type='offer', level='advanced')
+            UserSkill.objects.create(user=self.other, skill=skill_two, type='want', level='beginner')
+            UserSkill.objects.create(user=charlie, skill=self.skill, type='offer', level='advanced')
+        expected = set(PartnerRecommendation.objects.values_list('user', 'candidate', 'final_score'))
+        self.assertEqual(expected, {
+            (self.user.pk, self.other.pk, 2),
+            (self.user.pk, charlie.pk, 1),
+            (self.other.pk, self.user.pk, 2),
+        })
+
+        PartnerRecommendation.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_recommendations', workers=1, stdout=out)
+        self.assertEqual(set(PartnerRecommendation.objects.values_list('user', 'candidate', 'final_score')), expected)
+        self.assertIn('users/sec', out.getvalue())
+
+        # With --since only learners affected by recent skill changes are rebuilt
+        PartnerRecommendation.objects.all().delete()
+        UserSkill.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        UserSkill.objects.filter(user=charlie).update(updated_at=timezone.now())
+        call_command('rebuild_recommendations', workers=1, since=str(timezone.now().date()), stdout=StringIO())
+        self.assertEqual(
+            set(PartnerRecommendation.objects.values_list('user', 'candidate', 'final_score')),
+            {(self.user.pk, self.other.pk, 2), (self.user.pk, charlie.pk, 1)},
+        )
+
+        # Deletions leave no timestamp, but rows that no longer match the skills are rebuilt too
+        UserSkill.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        UserSkill.objects.filter(user=self.other, type='want').delete()
+        UserSkill.objects.filter(user=charlie).delete()
+        call_command('rebuild_recommendations', workers=1, since=str(timezone.now().date()), stdout=StringIO())
+        self.assertEqual(
+            set(PartnerRecommendation.objects.values_list('user', 'candidate', 'final_score')),
+            {(self.user.pk, self.other.pk, 1)},
+        )
+
     def test_feedback_permissions_and_constraints(self):
         # Build a match first for feedback testing
         request_obj = Request.objects.create(
@@ -277,10 +450,113 @@ class SkillSwapTests(TestCase):
             status='open',
         )
         self.client.login(username='alice', password='password123')
-        self.client.post(reverse('skillswap:match-create', args=[request_obj.pk]))
+        # Notifications are sent by a task enqueued once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('skillswap:match-create', args=[request_obj.pk]))
         notification = Notification.objects.get(user=self.other, verb=Notification.Verb.INVITE_SENT)
         self.assertIn('match invite', notification.message)
 
+    def test_match_notifications_wait_for_commit(self):
+        # The fan-out is enqueued after commit, so saving the match itself does not create notifications
+        request_obj = Request.objects.create(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            match = Match.objects.create(
+                request=request_obj,
+                requester=self.user,
+                partner=self.other,
+                status=Match.Status.PENDING,
+            )
+            self.assertFalse(Notification.objects.filter(match=match).exists())
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(Notification.objects.get(match=match).user, self.other)
+
+    def test_match_transition_is_one_conditional_update(self):
+        # A transition is a single UPDATE guarded by the expected status, and a stale second one is refused
+        request_obj = Request.objects.create(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        match = Match.objects.create(
+            request=request_obj,
+            requester=self.user,
+            partner=self.other,
+            status=Match.Status.PENDING,
+        )
+        stale_copy = Match.objects.get(pk=match.pk)
+
+        # The notification task runs on commit, after the captured block
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(match.transition(Match.Status.REJECTED), Match.Status.PENDING)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "skillswap_match"')]), 1)
+        self.assertFalse(any(query['sql'].startswith('SELECT "skillswap_match"') for query in queries))
+        self.assertTrue(Notification.objects.filter(match=match, verb=Notification.Verb.INVITE_REJECTED).exists())
+
+        # The other tab still thinks the match is pending, but the database refuses the accept
+        self.assertIsNone(stale_copy.transition(Match.Status.ACCEPTED))
+        self.assertIsNone(match.transition(Match.Status.PENDING))
+        match.refresh_from_db()
+        self.assertEqual(match.status, Match.Status.REJECTED)
+        self.assertFalse(Conversation.objects.filter(match=match).exists())
+
+    def test_completed_match_notifications_use_one_insert(self):
+        # Both completion notifications are written together and still count as unread for each user
+        request_obj = Request.objects.create(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        match = Match.objects.create(
+            request=request_obj,
+            requester=self.user,
+            partner=self.other,
+            status=Match.Status.ACCEPTED,
+        )
+        with CaptureQueriesContext(connection) as queries:
+            created = send_match_notifications.call(match.pk, Match.Status.COMPLETED, False)
+        self.assertEqual(created, 2)
+        statements = [query['sql'] for query in queries]
+        self.assertEqual(sum(sql.startswith('INSERT INTO "skillswap_notification"') for sql in statements), 1)
+        self.assertEqual(sum(sql.startswith('SELECT') for sql in statements), 1)
+        self.assertEqual(unread_counts(self.user), (1, 0))
+        self.assertEqual(unread_counts(self.other), (1, 0))
+        self.assertEqual(
+            set(Notification.objects.filter(match=match).values_list('user__username', 'verb')),
+            {('alice', Notification.Verb.MATCH_COMPLETED), ('bob', Notification.Verb.MATCH_COMPLETED)},
+        )
+
+    def test_background_thread_task_backend(self):
+        # Enqueue returns straight away and the task runs on the backend's thread pool
+        backend = BackgroundThreadBackend('background', {'OPTIONS': {'max_workers': 1}})
+        release = threading.Event()
+        backend._executor.submit(release.wait, 5)
+        result = backend.enqueue(add_numbers, [2, 3], {})
+        self.assertEqual(result.status, TaskResultStatus.READY)
+        self.assertEqual(result.backend, 'background')
+        release.set()
+        backend._executor.shutdown(wait=True)
+        self.assertEqual(result.status, TaskResultStatus.SUCCESSFUL)
+        self.assertEqual(result.return_value, 5)
+
+        # Nobody reads the results of background tasks, so failures are logged
+        backend = BackgroundThreadBackend('background', {'OPTIONS': {'max_workers': 1}})
+        with self.assertLogs('skillswap.task_backends', 'ERROR') as logs:
+            result = backend.enqueue(divide_numbers, [1, 0], {})
+            backend._executor.shutdown(wait=True)
+        self.assertEqual(result.status, TaskResultStatus.FAILED)
+        self.assertIn('ZeroDivisionError', logs.output[0])
+
     def test_notification_created_on_match_accept(self):
         # Accepting a match should notify the requester
         request_obj = Request.objects.create(
@@ -297,11 +573,59 @@ class SkillSwapTests(TestCase):
             status=Match.Status.PENDING,
         )
         self.client.login(username='bob', password='password123')
-        self.client.post(reverse('skillswap:match-action', args=[match.pk, 'accept']))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('skillswap:match-action', args=[match.pk, 'accept']))
         self.assertTrue(
             Notification.objects.filter(user=self.user, verb=Notification.Verb.INVITE_ACCEPTED).exists()
         )
 
+    def test_status_saved_outside_transition_still_notifies(self):
+        # Saving the status field directly, or editing it in the admin, has the same side effects as transition()
+        request_obj = Request.objects.create(
+            user=self.other, skill=self.skill, title='Need Python help', description='Functions', status='open')
+        match = Match.objects.create(
+            request=request_obj, requester=self.user, partner=self.other, status=Match.Status.PENDING)
+        match.status = Match.Status.ACCEPTED
+        with self.captureOnCommitCallbacks(execute=True):
+            match.save(update_fields=['status'])
+        self.assertTrue(Conversation.objects.filter(match=match).exists())
+        accepted = Notification.objects.filter(user=self.user, match=match, verb=Notification.Verb.INVITE_ACCEPTED)
+        self.assertEqual(accepted.count(), 1)
+
+        # Saving again without changing the status sends nothing new
+        with self.captureOnCommitCallbacks(execute=True):
+            match.save(update_fields=['status'])
+            Match.objects.get(pk=match.pk).save()
+        self.assertEqual(accepted.count(), 1)
+
+        # A full save() of a loaded match that changes the status counts as well
+        other_match = Match.objects.create(
+            request=request_obj, requester=self.other, partner=self.user, status=Match.Status.PENDING)
+        other_match = Match.objects.get(pk=other_match.pk)
+        other_match.status = Match.Status.ACCEPTED
+        with self.captureOnCommitCallbacks(execute=True):
+            other_match.save()
+        self.assertTrue(Conversation.objects.filter(match=other_match).exists())
+        self.assertTrue(Notification.objects.filter(
+            user=self.other, match=other_match, verb=Notification.Verb.INVITE_ACCEPTED).exists())
+
+        User.objects.create_superuser(username='admin', password='password123')
+        self.client.login(username='admin', password='password123')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('admin:skillswap_match_change', args=[match.pk]),
+                {
+                    'request': request_obj.pk,
+                    'requester': self.user.pk,
+                    'partner': self.other.pk,
+                    'status': Match.Status.COMPLETED,
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            Notification.objects.filter(match=match, verb=Notification.Verb.MATCH_COMPLETED).count(), 2
+        )
+
     def test_notification_visibility_and_mark_read(self):
         # User should only see their own notifications
         notification = Notification.objects.create(
@@ -327,6 +651,214 @@ class SkillSwapTests(TestCase):
         notification.refresh_from_db()
         self.assertTrue(notification.is_read)
 
+    def test_notification_feed_is_paginated_by_cursor(self):
+        # The feed shows one page at a time, newest first, and can be limited to unread items
+        for index in range(NOTIFICATION_PAGE_SIZE + 3):
+            Notification.objects.create(
+                user=self.user,
+                verb=Notification.Verb.INVITE_SENT,
+                message=f'Note {index}',
+                is_read=index % 2 == 1,
+            )
+        self.client.login(username='alice', password='password123')
+        response = self.client.get(reverse('skillswap:notifications'))
+        first_page = response.context['notifications']
+        self.assertEqual(len(first_page), NOTIFICATION_PAGE_SIZE)
+        self.assertEqual(first_page[0].message, f'Note {NOTIFICATION_PAGE_SIZE + 2}')
+
+        response = self.client.get(reverse('skillswap:notifications'), {'cursor': response.context['next_cursor']})
+        self.assertEqual([note.message for note in response.context['notifications']], ['Note 2', 'Note 1', 'Note 0'])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertIsNone(response.context['newest_cursor'])
+
+        response = self.client.get(reverse('skillswap:notifications'), {'unread': '1'})
+        messages = [note.message for note in response.context['notifications']]
+        self.assertEqual(len(messages), (NOTIFICATION_PAGE_SIZE + 4) // 2)
+        self.assertTrue(all(int(message.split()[1]) % 2 == 0 for message in messages))
+
+        response = self.client.get(reverse('skillswap:notifications'), {'cursor': 'bad'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_mark_all_read_for_notifications_and_conversations(self):
+        # Bulk actions clear unread rows with single updates and keep the counters in step
+        for index in range(3):
+            Notification.objects.create(user=self.user, verb=Notification.Verb.INVITE_SENT, message=f'Note {index}')
+        self.client.login(username='alice', password='password123')
+        cursor = self.client.get(reverse('skillswap:notifications')).context['newest_cursor']
+        # Arrives after the page was rendered, so it stays unread
+        Notification.objects.create(user=self.user, verb=Notification.Verb.INVITE_SENT, message='Late')
+
+        response = self.client.post(reverse('skillswap:notifications-read-all'), {'before': cursor})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(self.user.notifications.filter(is_read=False).values_list('message', flat=True)),
+                         ['Late'])
+        self.assertEqual(unread_counts(self.user), (1, 0))
+        self.client.post(reverse('skillswap:notifications-read-all'))
+        self.assertEqual(unread_counts(self.user), (0, 0))
+
+        conversations = []
+        for partner in (self.other, User.objects.create_user(username='carol', password='password123')):
+            request_obj = Request.objects.create(
+                user=partner,
+                skill=self.skill,
+                title='Need Python help',
+                description='Functions and classes',
+                status='open',
+            )
+            match = Match.objects.create(
+                request=request_obj,
+                requester=self.user,
+                partner=partner,
+                status=Match.Status.ACCEPTED,
+            )
+            Message.objects.create(conversation=match.conversation, sender=partner, body='Hi')
+            Message.objects.create(conversation=match.conversation, sender=self.user, body='Hello')
+            conversations.append(match.conversation)
+        self.assertEqual(unread_counts(self.user), (0, 2))
+
+        self.client.post(reverse('skillswap:inbox-read-all'))
+        self.assertEqual(unread_counts(self.user), (0, 0))
+        for conversation in conversations:
+            conversation.refresh_from_db()
+            self.assertEqual((conversation.requester_unread_count, conversation.partner_unread_count), (0, 1))
+        # Messages alice sent are still unread for the other side
+        self.assertEqual(Message.objects.filter(is_read=False, sender=self.user).count(), 2)
+
+    def test_unread_counters_follow_notifications_and_messages(self):
+        # Counters on the profile should track unread rows without recounting them
+        request_obj = Request.objects.create(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        match = Match.objects.create(
+            request=request_obj,
+            requester=self.user,
+            partner=self.other,
+            status=Match.Status.ACCEPTED,
+        )
+        conversation = Conversation.objects.get(match=match)
+        notification = Notification.objects.create(
+            user=self.user,
+            actor=self.other,
+            verb=Notification.Verb.INVITE_SENT,
+            message='Test notification',
+        )
+        Message.objects.create(conversation=conversation, sender=self.other, body='Ping')
+        Message.objects.create(conversation=conversation, sender=self.other, body='Pong')
+
+        self.client.login(username='alice', password='password123')
+        response = self.client.get(reverse('skillswap:dashboard'))
+        self.assertEqual(response.context['unread_notifications_count'], 1)
+        self.assertEqual(response.context['unread_messages_count'], 2)
+
+        # Reading the notification twice only counts once
+        self.client.post(reverse('skillswap:notification-read', args=[notification.pk]))
+        self.client.post(reverse('skillswap:notification-read', args=[notification.pk]))
+        response = self.client.get(reverse('skillswap:inbox-detail', args=[match.pk]))
+        self.assertEqual(response.context['unread_notifications_count'], 0)
+        self.assertEqual(response.context['unread_messages_count'], 0)
+        self.other.profile.refresh_from_db()
+        self.assertEqual(self.other.profile.unread_messages_count, 0)
+
+    def test_navbar_counts_are_lazy_and_cached(self):
+        # Counts are only looked up when used, then served from the cache until a counter changes
+        request_obj = Request.objects.create(
+            user=self.other, skill=self.skill, title='Need Python help', description='Functions', status='open')
+        match = Match.objects.create(
+            request=request_obj, requester=self.user, partner=self.other, status=Match.Status.ACCEPTED)
+        Message.objects.create(
+            conversation=Conversation.objects.get(match=match), sender=self.other, body='Hi', is_read=True)
+        cursor = encode_cursor([timezone.now() + timedelta(days=1), 0])
+        self.client.login(username='alice', password='password123')
+        # One request first, so the once-a-minute activity write is not part of the measured one
+        self.client.get(reverse('skillswap:inbox-older', args=[match.pk]), {'cursor': cursor})
+        cache.clear()
+        count_lookup = 'SELECT "skillswap_profile"."unread_notifications_count"'
+
+        # A fragment without the navbar goes through the context processors but never reads the counts:
+        # session, viewer, match, its two participants and the messages
+        with self.assertNumQueries(6) as queries:
+            response = self.client.get(reverse('skillswap:inbox-older', args=[match.pk]), {'cursor': cursor})
+        self.assertContains(response, 'Hi')
+        self.assertFalse(any(query['sql'].startswith(count_lookup) for query in queries.captured_queries))
+
+        # Full pages print the badges, which read the counts once for both
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('skillswap:dashboard'))
+        self.assertEqual(sum(query['sql'].startswith(count_lookup) for query in queries), 1)
+        response = self.client.get(reverse('skillswap:dashboard'))
+        badge = response.context['unread_notifications_count']
+        with self.assertNumQueries(0):
+            self.assertEqual(badge, 0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_counts(self.user), (0, 0))
+        Notification.objects.create(user=self.user, verb=Notification.Verb.INVITE_SENT, message='One')
+        self.assertEqual(unread_counts(self.user), (1, 0))
+
+        # Counts re-cached by a concurrent request before the change commits are cleared once it does
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, verb=Notification.Verb.INVITE_SENT, message='Two')
+            cache.set(_unread_cache_key(self.user.pk), (1, 0))
+        self.assertEqual(unread_counts(self.user), (2, 0))
+
+    def test_prune_notifications_command(self):
+        # Old read notifications are deleted in batches and duplicate unread ones are collapsed
+        request_obj = Request.objects.create(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            match = Match.objects.create(
+                request=request_obj,
+                requester=self.other,
+                partner=self.user,
+                status=Match.Status.PENDING,
+            )
+        # The match task already sent one invite notification; add two more copies
+        for _ in range(2):
+            Notification.objects.create(user=self.user, match=match, verb=Notification.Verb.INVITE_SENT, message='Again')
+        for index in range(3):
+            Notification.objects.create(user=self.user, verb=Notification.Verb.INVITE_SENT, message=f'Old {index}',
+                                        is_read=True)
+        Notification.objects.filter(message__startswith='Old').update(created_at=timezone.now() - timedelta(days=120))
+        recent = Notification.objects.create(user=self.user, verb=Notification.Verb.INVITE_SENT, message='Recent',
+                                             is_read=True)
+        self.assertEqual(unread_counts(self.user), (3, 0))
+
+        out = StringIO()
+        call_command('prune_notifications', '--dry-run', stdout=out)
+        self.assertIn('Would delete 3 read notifications', out.getvalue())
+        self.assertIn('Would collapse 2 duplicate unread notifications', out.getvalue())
+        self.assertEqual(Notification.objects.count(), 7)
+
+        call_command('prune_notifications', '--batch-size', '2', stdout=StringIO())
+        self.assertFalse(Notification.objects.filter(message__startswith='Old').exists())
+        self.assertTrue(Notification.objects.filter(pk=recent.pk).exists())
+        unread = Notification.objects.filter(user=self.user, is_read=False)
+        self.assertEqual(unread.count(), 1)
+        self.assertEqual(unread.get().message, 'Again')
+        self.assertEqual(unread_counts(self.user), (1, 0))
+
+    def test_reconcile_unread_counters_command(self):
+        # The reconcile command should repair counters that drifted from the real rows
+        Notification.objects.create(user=self.user, verb=Notification.Verb.INVITE_SENT, message='One')
+        Profile.objects.filter(user=self.user).update(unread_notifications_count=5, unread_messages_count=3)
+
+        out = StringIO()
+        call_command('reconcile_unread_counters', '--dry-run', stdout=out)
+        self.assertIn('Found 1 profiles', out.getvalue())
+        call_command('reconcile_unread_counters', stdout=StringIO())
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.unread_notifications_count, 1)
+        self.assertEqual(self.user.profile.unread_messages_count, 0)
+
     def test_userskill_through_profile(self):
         # Test extra fields stored in the through model
         user_skill = UserSkill.objects.create(
@@ -351,6 +883,62 @@ class SkillSwapTests(TestCase):
         self.assertEqual(self.user.profile.last_path, reverse('skillswap:dashboard'))
         self.assertLessEqual(self.user.profile.last_active, timezone.now())
 
+    async def test_activity_middleware_async_path_is_throttled_by_session(self):
+        # Under ASGI the middleware runs natively async and skips the write while the session stamp is fresh
+        async def view(request):
+            return None
+        self.assertTrue(iscoroutinefunction(ActivityMiddleware(view)))
+
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(reverse('skillswap:dashboard'))
+        profile = await Profile.objects.aget(user=self.user)
+        self.assertIsNotNone(profile.last_active)
+        self.assertEqual(profile.last_path, reverse('skillswap:dashboard'))
+
+        await Profile.objects.filter(user=self.user).aupdate(last_active=None)
+        await self.async_client.get(reverse('skillswap:my-skills'))
+        profile = await Profile.objects.aget(user=self.user)
+        self.assertIsNone(profile.last_active)
+
+    @override_settings(
+        SKILLSWAP_ACTIVITY_MODE='buffered',
+        SKILLSWAP_ACTIVITY_FLUSH_INTERVAL=3600,
+        SKILLSWAP_ACTIVITY_FLUSH_SIZE=100,
+    )
+    def test_buffered_activity_is_written_in_one_batch(self):
+        # Buffered mode keeps visits in memory and writes them together, never on the request itself
+        activity_buffer.flush()
+        self.client.login(username='alice', password='password123')
+        self.client.get(reverse('skillswap:dashboard'))
+        self.user.profile.refresh_from_db()
+        self.assertIsNone(self.user.profile.last_active)
+        activity_buffer.record(self.user.pk, timezone.now(), reverse('skillswap:profile-edit'))
+        activity_buffer.record(self.other.pk, timezone.now(), '/explore/')
+
+        other_profile = self.other.profile
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(activity_buffer.flush(), 2)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries), 1)
+
+        # Only the latest visit per user is kept
+        self.user.profile.refresh_from_db()
+        other_profile.refresh_from_db()
+        self.assertEqual(self.user.profile.last_path, reverse('skillswap:profile-edit'))
+        self.assertEqual(other_profile.last_path, '/explore/')
+        self.assertIsNotNone(other_profile.last_active)
+        self.assertEqual(activity_buffer.flush(), 0)
+
+        # A failed write keeps the batch; a newer visit replaces the one that could not be written
+        activity_buffer.record(self.user.pk, timezone.now(), '/matches/')
+        activity_buffer.record(self.other.pk, timezone.now(), object())
+        with self.assertRaises(DatabaseError):
+            activity_buffer.flush()
+        activity_buffer.record(self.other.pk, timezone.now(), '/inbox/')
+        self.assertEqual(activity_buffer.flush(), 2)
+        self.user.profile.refresh_from_db()
+        other_profile.refresh_from_db()
+        self.assertEqual((self.user.profile.last_path, other_profile.last_path), ('/matches/', '/inbox/'))
+
     def test_password_change_requires_login(self):
         # Password change page should not be accessible without login
         response = self.client.get(reverse('password_change'))
@@ -398,6 +986,250 @@ class SkillSwapTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertNotIn(other_request, list(response.context['requests']))
 
+    @skipIf(connection.vendor not in search.KEY_COLUMN, 'database has no full-text search index')
+    def test_explore_request_search_is_ranked_and_prefix_matched(self):
+        # Title matches rank above description matches, and partial words match as prefixes
+        guitar = Skill.objects.create(name='Guitar', category='music')
+        in_description = Request.objects.create(
+            user=self.other, skill=guitar, title='Weekend practice', description='Some Django questions too')
+        in_title = Request.objects.create(
+            user=self.other, skill=self.skill, title='Django forms', description='Validation help')
+        Request.objects.create(user=self.other, skill=guitar, title='Chords', description='Barre chords')
+        self.client.login(username='alice', password='password123')
+
+        response = self.client.get(reverse('skillswap:explore-requests'), {'q': 'djan'})
+        self.assertEqual(list(response.context['requests']), [in_title, in_description])
+        response = self.client.get(reverse('skillswap:explore-requests'), {'q': 'guit cho'})
+        self.assertEqual([item.title for item in response.context['requests']], ['Chords'])
+
+        # Edits, skill renames and closing a request are reflected straight away
+        in_title.title = 'Flask forms'
+        in_title.save()
+        guitar.name = 'Ukulele'
+        guitar.save()
+        in_description.status = Request.Status.CLOSED
+        in_description.save()
+        self.assertEqual(search.search_request_ids('django'), [])
+        self.assertEqual(search.search_request_ids('flask'), [in_title.pk])
+        self.assertEqual(len(search.search_request_ids('ukulele')), 1)
+
+        # The rebuild command produces the same index from scratch
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 2 open requests', out.getvalue())
+        self.assertEqual(search.search_request_ids('flask'), [in_title.pk])
+
+    @skipIf(connection.vendor not in search.KEY_COLUMN, 'database has no full-text search index')
+    def test_explore_request_search_caps_after_filtering(self):
+        # The viewer's own requests outrank everyone else's, but the result cap only counts what can be shown
+        music = Skill.objects.create(name='Piano', category='music')
+        Request.objects.bulk_create([
+            Request(user=self.user, skill=music, title=f'Lesson {index}', description='Lesson lesson lesson')
+            for index in range(search.RESULT_LIMIT + 50)
+        ])
+        other_request = Request.objects.create(
+            user=self.other, skill=music, title='Weekly sessions', description='A lesson now and then')
+        search.rebuild_index()
+        self.client.login(username='alice', password='password123')
+
+        for params in ({'q': 'lesson'}, {'q': 'lesson', 'category': 'music'}):
+            response = self.client.get(reverse('skillswap:explore-requests'), params)
+            self.assertEqual(list(response.context['requests']), [other_request])
+
+    @override_settings(SKILLSWAP_EXPLORE_PAGINATION='keyset')
+    def test_explore_pages_by_cursor_without_counting(self):
+        # Keyset mode pages newest first, links both ways and never runs COUNT(*)
+        created = [
+            Request.objects.create(user=self.other, skill=self.skill, title=f'Request {index}', description='Help')
+            for index in range(12)
+        ]
+        self.client.login(username='alice', password='password123')
+        url = reverse('skillswap:explore-requests')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'category': 'programming'})
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        first_page = list(response.context['requests'])
+        self.assertEqual(first_page, created[::-1][:10])
+        page = response.context['page_obj']
+        self.assertFalse(page.has_previous)
+
+        response = self.client.get(url, {'category': 'programming', 'cursor': page.next_cursor})
+        self.assertEqual(list(response.context['requests']), created[1::-1])
+        page = response.context['page_obj']
+        self.assertFalse(page.has_next)
+        self.assertContains(response, 'category=programming')
+
+        response = self.client.get(url, {'category': 'programming', 'before': page.previous_cursor})
+        self.assertEqual(list(response.context['requests']), first_page)
+        self.assertFalse(response.context['page_obj'].has_previous)
+
+        # Users are paged alphabetically
+        for index in range(12):
+            User.objects.create_user(username=f'user{index:02d}', password='password123')
+        response = self.client.get(reverse('skillswap:explore-users'))
+        page = response.context['page_obj']
+        self.assertEqual([user.username for user in page][:2], ['bob', 'user00'])
+        response = self.client.get(reverse('skillswap:explore-users'), {'cursor': page.next_cursor})
+        self.assertEqual([user.username for user in response.context['users']], ['user11'])
+
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+
+    def test_explore_count_is_cached_per_filter_and_block_list(self):
+        # Flipping pages reuses the count; a different filter or block list gets its own
+        for index in range(12):
+            Request.objects.create(user=self.other, skill=self.skill, title=f'Request {index}', description='Help')
+        self.client.login(username='alice', password='password123')
+        url = reverse('skillswap:explore-requests')
+
+        response = self.client.get(url, {'category': 'Programming'})
+        self.assertEqual(response.context['paginator'].count, 12)
+        self.assertContains(response, '12 results')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'category': 'programming', 'page': 2})
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        self.assertEqual(len(response.context['requests']), 2)
+
+        Block.objects.create(blocker=self.user, blocked=self.other)
+        response = self.client.get(url, {'category': 'programming'})
+        self.assertEqual(response.context['paginator'].count, 0)
+
+        # Past the limit the count stops at it and is reported as a lower bound
+        paginator = CachedCountPaginator(Request.objects.all(), 10)
+        paginator.count_limit = 5
+        self.assertEqual(paginator.count, 5)
+        self.assertFalse(paginator.count_is_exact)
+        self.assertEqual(paginator.count_label, '5+')
+        self.assertEqual(paginator.num_pages, 1)
+
+    def test_explore_pages_continue_past_an_inexact_count(self):
+        # The count stops at 1000 rows, but every page with rows still opens and Next follows the real rows
+        Request.objects.bulk_create([
+            Request(user=self.other, skill=self.skill, title=f'Request {index}', description='Help')
+            for index in range(1015)
+        ])
+        self.client.login(username='alice', password='password123')
+        url = reverse('skillswap:explore-requests')
+
+        response = self.client.get(url, {'page': 100})
+        self.assertFalse(response.context['paginator'].count_is_exact)
+        self.assertTrue(response.context['page_obj'].has_next())
+        self.assertContains(response, '1000+ results')
+        response = self.client.get(url, {'page': 101})
+        self.assertEqual(len(response.context['requests']), 10)
+        self.assertTrue(response.context['page_obj'].has_next())
+        self.assertContains(response, 'page=102')
+        response = self.client.get(url, {'page': 102})
+        self.assertEqual(len(response.context['requests']), 5)
+        self.assertFalse(response.context['page_obj'].has_next())
+        self.assertEqual(response.context['page_obj'].end_index(), 1015)
+        self.assertEqual(self.client.get(url, {'page': 103}).status_code, 404)
+
+    def test_explore_users_skill_filter_uses_exists(self):
+        # Name and type must match the same skill entry, and users appear once without DISTINCT
+        guitar = Skill.objects.create(name='Guitar', category='music')
+        charlie = User.objects.create_user(username='charlie', password='password123')
+        UserSkill.objects.create(user=self.other, skill=self.skill, type='offer', level='advanced')
+        UserSkill.objects.create(user=self.other, skill=self.skill, type='want', level='beginner')
+        UserSkill.objects.create(user=charlie, skill=self.skill, type='want', level='beginner')
+        UserSkill.objects.create(user=charlie, skill=guitar, type='offer', level='advanced')
+        self.client.login(username='alice', password='password123')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('skillswap:explore-users'), {'skill': 'pyth', 'type': 'offer'})
+        self.assertEqual(list(response.context['users']), [self.other])
+        user_queries = [query['sql'] for query in queries if 'FROM "auth_user"' in query['sql']]
+        self.assertTrue(any('EXISTS' in sql for sql in user_queries))
+        self.assertFalse(any('DISTINCT' in sql for sql in user_queries))
+
+        response = self.client.get(reverse('skillswap:explore-users'), {'skill': 'python'})
+        self.assertCountEqual(response.context['users'], [self.other, charlie])
+
+        # The benchmark compares both query shapes and leaves no data behind
+        out = StringIO()
+        call_command('benchmark_explore_users', users=20, skills=10, repeat=1, stdout=out)
+        self.assertIn('JOIN + DISTINCT', out.getvalue())
+        self.assertIn('EXISTS', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='bench-').exists())
+
+    def test_skill_autocomplete_uses_prefix_index(self):
+        # Suggestions match the start of the name or of a later word, and follow skill changes
+        web = Skill.objects.create(name='Web Design', category='art')
+        pottery = Skill.objects.create(name='Pottery', category='art')
+        Skill.objects.create(name='Écriture', category='language')
+        self.client.login(username='alice', password='password123')
+        url = reverse('skillswap:skill-autocomplete')
+
+        response = self.client.get(url, {'q': 'p'})
+        self.assertEqual([item['name'] for item in response.json()['results']], ['Pottery', 'Python'])
+        self.assertEqual(self.client.get(url, {'q': ' DES'}).json()['results'][0]['id'], web.pk)
+        self.assertEqual(self.client.get(url, {'q': 'ecri'}).json()['results'][0]['name'], 'Écriture')
+        self.assertEqual(self.client.get(url).json()['results'], [])
+
+        # Once built, the index answers without touching the database until a skill changes
+        with self.assertNumQueries(0):
+            get_skill_index().suggest('py')
+        # The index version only moves once the rename has committed
+        pottery.name = 'Ceramics'
+        with self.captureOnCommitCallbacks(execute=True):
+            pottery.save()
+            self.assertEqual(get_skill_index().skills[pottery.pk]['name'], 'Pottery')
+        response = self.client.get(url, {'q': 'p'})
+        self.assertEqual([item['name'] for item in response.json()['results']], ['Python'])
+
+        # The skill select renders only the chosen skill instead of the whole table
+        response = self.client.get(reverse('skillswap:user-skill-add'))
+        self.assertNotContains(response, 'Web Design')
+        self.assertContains(response, f'data-autocomplete-url="{url}"')
+        form = UserSkillForm(data={'skill': web.pk, 'type': 'offer', 'level': 'beginner'})
+        self.assertTrue(form.is_valid())
+        self.assertIn('Web Design', str(form['skill']))
+        self.assertNotIn('Python', str(form['skill']))
+
+    def test_block_checks_served_from_cache(self):
+        # Block lookups should be cached and refreshed when blocks change
+        charlie = User.objects.create_user(username='charlie', password='password123')
+        self.assertEqual(blocked_user_ids(self.user), frozenset())
+
+        Block.objects.create(blocker=self.user, blocked=self.other)
+        Block.objects.create(blocker=charlie, blocked=self.user)
+        self.assertEqual(blocked_user_ids(self.user), {self.other.pk, charlie.pk})
+        with self.assertNumQueries(0):
+            self.assertTrue(is_blocked(self.user, self.other))
+            self.assertTrue(is_blocked(self.user, charlie))
+            self.assertEqual(blocked_user_ids(self.user), {self.other.pk, charlie.pk})
+
+        # The other side of the block sees it too, and removing it clears both caches
+        self.assertTrue(is_blocked(self.other, self.user))
+        Block.objects.filter(blocker=self.user, blocked=self.other).delete()
+        self.assertFalse(is_blocked(self.user, self.other))
+        self.assertFalse(is_blocked(self.other, self.user))
+
+        # A stale list cached by a concurrent request before the block commits is cleared once it does
+        with self.captureOnCommitCallbacks(execute=True):
+            Block.objects.create(blocker=self.user, blocked=self.other)
+            cache.set(_block_cache_key(self.user.pk), (frozenset(), frozenset()))
+        self.assertTrue(is_blocked(self.user, self.other))
+
+    def test_profile_page_block_flags_use_one_lookup(self):
+        # Both block flags on the profile page come from a single per-request lookup
+        Block.objects.create(blocker=self.user, blocked=self.other)
+        self.client.login(username='alice', password='password123')
+        response = self.client.get(reverse('skillswap:profile-detail', args=[self.other.username]))
+        self.assertTrue(response.context['is_blocked'])
+        self.assertTrue(response.context['has_blocked'])
+
+        self.client.logout()
+        self.client.login(username='bob', password='password123')
+        response = self.client.get(reverse('skillswap:profile-detail', args=[self.user.username]))
+        self.assertTrue(response.context['is_blocked'])
+        self.assertFalse(response.context['has_blocked'])
+
+        # Once cached, repeat visits do not query the Block table at all
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('skillswap:profile-detail', args=[self.user.username]))
+        self.assertFalse([query for query in queries if 'skillswap_block' in query['sql']])
+
     def test_match_invite_blocked_forbidden(self):
         # Match invite should be forbidden if users blocked each other
         request_obj = Request.objects.create(
@@ -446,7 +1278,7 @@ class SkillSwapTests(TestCase):
             partner=self.other,
             status=Match.Status.ACCEPTED,
         )
-        conversation = Conversation.objects.create(match=match)
+        conversation = Conversation.objects.get(match=match)
         self.client.login(username='alice', password='password123')
         response = self.client.post(
             reverse('skillswap:inbox-send', args=[match.pk]),
@@ -476,7 +1308,6 @@ class SkillSwapTests(TestCase):
             partner=self.other,
             status=Match.Status.ACCEPTED,
         )
-        Conversation.objects.create(match=match)
         Block.objects.create(blocker=self.other, blocked=self.user)
         self.client.login(username='alice', password='password123')
         response = self.client.post(reverse('skillswap:inbox-send', args=[match.pk]), {'body': 'Hello'})
@@ -497,7 +1328,7 @@ class SkillSwapTests(TestCase):
             partner=self.other,
             status=Match.Status.ACCEPTED,
         )
-        conversation = Conversation.objects.create(match=match)
+        conversation = Conversation.objects.get(match=match)
         message = Message.objects.create(conversation=conversation, sender=self.other, body='Ping')
         self.client.login(username='alice', password='password123')
         response = self.client.get(reverse('skillswap:inbox-detail', args=[match.pk]))
@@ -505,6 +1336,270 @@ class SkillSwapTests(TestCase):
         message.refresh_from_db()
         self.assertTrue(message.is_read)
 
+    def test_conversation_snapshot_follows_messages(self):
+        # The conversation keeps its latest message and per-participant unread counts up to date
+        request_obj = Request.objects.create(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        match = Match.objects.create(
+            request=request_obj,
+            requester=self.user,
+            partner=self.other,
+            status=Match.Status.ACCEPTED,
+        )
+        conversation = match.conversation
+        first = Message.objects.create(conversation=conversation, sender=self.other, body='Ping')
+        latest = Message.objects.create(conversation=conversation, sender=self.other, body='x' * 200)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_message_at, latest.created_at)
+        self.assertEqual(conversation.last_message_sender, self.other)
+        self.assertEqual(len(conversation.last_message_preview), Conversation.PREVIEW_LENGTH)
+        self.assertEqual((conversation.requester_unread_count, conversation.partner_unread_count), (2, 0))
+
+        # Deleting the latest message falls back to the previous one
+        latest.delete()
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_message_preview, 'Ping')
+        self.assertEqual(conversation.last_message_at, first.created_at)
+        self.assertEqual(conversation.requester_unread_count, 1)
+
+        # Opening the conversation clears only the reader's counter
+        Message.objects.create(conversation=conversation, sender=self.user, body='Pong')
+        self.client.login(username='alice', password='password123')
+        self.client.get(reverse('skillswap:inbox-detail', args=[match.pk]))
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.requester_unread_count, conversation.partner_unread_count), (0, 1))
+        self.assertEqual(conversation.last_message_preview, 'Pong')
+
+    def test_inbox_detail_pages_messages_by_cursor(self):
+        # Only the latest page is rendered and older pages are fetched by cursor
+        request_obj = Request.objects.create(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        match = Match.objects.create(
+            request=request_obj,
+            requester=self.user,
+            partner=self.other,
+            status=Match.Status.ACCEPTED,
+        )
+        sent = [
+            Message.objects.create(conversation=match.conversation, sender=self.other, body=f'Message {index}')
+            for index in range(MESSAGE_PAGE_SIZE + 5)
+        ]
+        self.client.login(username='alice', password='password123')
+        response = self.client.get(reverse('skillswap:inbox-detail', args=[match.pk]))
+        self.assertEqual(response.context['conversation_messages'], sent[5:])
+        cursor = response.context['older_cursor']
+        self.assertIsNotNone(cursor)
+
+        response = self.client.get(reverse('skillswap:inbox-older', args=[match.pk]), {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['conversation_messages'], sent[:5])
+        self.assertIsNone(response.context['older_cursor'])
+        self.assertContains(response, 'Message 0')
+        self.assertNotContains(response, 'Load older messages')
+
+        response = self.client.get(reverse('skillswap:inbox-older', args=[match.pk]), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+        self.client.logout()
+        User.objects.create_user(username='eve', password='password123')
+        self.client.login(username='eve', password='password123')
+        response = self.client.get(reverse('skillswap:inbox-older', args=[match.pk]), {'cursor': cursor})
+        self.assertEqual(response.status_code, 403)
+
+    async def test_in_process_broker_delivers_published_messages(self):
+        # Listeners first catch up from the database, then receive what inbox_send publishes
+        request_obj = await Request.objects.acreate(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        match = await Match.objects.acreate(
+            request=request_obj,
+            requester=self.user,
+            partner=self.other,
+            status=Match.Status.ACCEPTED,
+        )
+        conversation = await Conversation.objects.aget(match=match)
+        stored = await Message.objects.acreate(conversation=conversation, sender=self.other, body='Stored')
+
+        broker = InProcessBroker()
+        async with aclosing(broker.listen(conversation.pk, 0)) as batches:
+            backlog = await anext(batches)
+            self.assertEqual([payload['id'] for payload in backlog], [stored.pk])
+
+            waiting = asyncio.ensure_future(anext(batches))
+            await asyncio.sleep(0.05)
+            live = Message(
+                id=stored.pk + 1,
+                conversation=conversation,
+                sender=self.other,
+                body='Live',
+                created_at=timezone.now(),
+            )
+            broker.publish_message(live)
+            batch = await asyncio.wait_for(waiting, 1)
+        self.assertEqual([payload['body'] for payload in batch], ['Live'])
+
+    @override_settings(SKILLSWAP_REALTIME_STREAM_SECONDS=0)
+    async def test_inbox_stream_sends_new_messages_as_events(self):
+        # The stream sends messages after the cursor as SSE events and marks the incoming ones read
+        request_obj = await Request.objects.acreate(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        match = await Match.objects.acreate(
+            request=request_obj,
+            requester=self.user,
+            partner=self.other,
+            status=Match.Status.ACCEPTED,
+        )
+        conversation = await Conversation.objects.aget(match=match)
+        old = await Message.objects.acreate(conversation=conversation, sender=self.other, body='Old')
+        new = await Message.objects.acreate(conversation=conversation, sender=self.other, body='New')
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse('skillswap:inbox-stream', args=[match.pk]), {'after': old.pk}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn(f'id: {new.pk}\n', body)
+        self.assertNotIn(f'id: {old.pk}\n', body)
+        await new.arefresh_from_db()
+        self.assertTrue(new.is_read)
+
+        await self.async_client.alogout()
+        await User.objects.acreate_user(username='eve', password='password123')
+        await self.async_client.alogin(username='eve', password='password123')
+        response = await self.async_client.get(reverse('skillswap:inbox-stream', args=[match.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(SKILLSWAP_REALTIME_POLL_INTERVAL=2)
+    def test_inbox_stream_answers_like_a_poll_under_wsgi(self):
+        # Without ASGI the stream sends what is new and closes, telling EventSource when to come back
+        request_obj = Request.objects.create(
+            user=self.other, skill=self.skill, title='Need Python help', description='Functions', status='open')
+        match = Match.objects.create(
+            request=request_obj, requester=self.user, partner=self.other, status=Match.Status.ACCEPTED)
+        conversation = Conversation.objects.get(match=match)
+        old = Message.objects.create(conversation=conversation, sender=self.other, body='Old')
+        new = Message.objects.create(conversation=conversation, sender=self.other, body='New')
+
+        self.client.login(username='alice', password='password123')
+        response = self.client.get(
+            reverse('skillswap:inbox-stream', args=[match.pk]), HTTP_LAST_EVENT_ID=str(old.pk))
+        self.assertFalse(response.streaming)
+        body = response.content.decode()
+        self.assertTrue(body.startswith('retry: 2000\n\n'))
+        self.assertIn(f'id: {new.pk}\n', body)
+        self.assertNotIn(f'id: {old.pk}\n', body)
+        new.refresh_from_db()
+        self.assertTrue(new.is_read)
+
+    def test_inbox_since_returns_new_messages_and_not_modified(self):
+        # Polling clients get only newer messages as JSON, and an unchanged conversation answers 304
+        request_obj = Request.objects.create(
+            user=self.other,
+            skill=self.skill,
+            title='Need Python help',
+            description='Functions and classes',
+            status='open',
+        )
+        match = Match.objects.create(
+            request=request_obj,
+            requester=self.user,
+            partner=self.other,
+            status=Match.Status.ACCEPTED,
+        )
+        first = Message.objects.create(conversation=match.conversation, sender=self.other, body='One')
+        second = Message.objects.create(conversation=match.conversation, sender=self.other, body='Two')
+        url = reverse('skillswap:inbox-since', args=[match.pk])
+        self.client.login(username='alice', password='password123')
+
+        response = self.client.get(url, {'after': first.pk})
+        data = response.json()
+        self.assertEqual([message['body'] for message in data['messages']], ['Two'])
+        self.assertEqual(data['unread_count'], 2)
+        self.assertEqual(data['cursor'], second.pk)
+
+        response = self.client.get(url, {'after': second.pk})
+        self.assertEqual(response.json()['messages'], [])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'after': second.pk}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(sum('skillswap_conversation' in query['sql'] for query in queries), 1)
+        self.assertFalse(any('skillswap_message' in query['sql'] for query in queries))
+
+        # A new message changes the ETag
+        etag = response['ETag']
+        Message.objects.create(conversation=match.conversation, sender=self.other, body='Three')
+        response = self.client.get(url, {'after': second.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['unread_count'], 3)
+
+        self.client.logout()
+        User.objects.create_user(username='eve', password='password123')
+        self.client.login(username='eve', password='password123')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_inbox_list_query_count_is_constant(self):
+        # Matches saved as accepted get a conversation right away, and the inbox loads in one query
+        def add_conversation(partner, body):
+            request_obj = Request.objects.create(
+                user=partner,
+                skill=self.skill,
+                title=f'Help from {partner.username}',
+                description='Functions and classes',
+                status='open',
+            )
+            match = Match.objects.create(
+                request=request_obj,
+                requester=self.user,
+                partner=partner,
+                status=Match.Status.ACCEPTED,
+            )
+            Message.objects.create(conversation=match.conversation, sender=partner, body=body)
+
+        def inbox_queries():
+            # Navbar counts come from the cache when warm, so start each measurement cold
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('skillswap:inbox'))
+            self.assertEqual(response.status_code, 200)
+            return response, len(queries)
+
+        add_conversation(self.other, 'First hello')
+        self.client.login(username='alice', password='password123')
+        # The first request after login also records activity, so measure from the second
+        inbox_queries()
+        _, single = inbox_queries()
+
+        for index in range(3):
+            add_conversation(User.objects.create_user(username=f'peer{index}', password='password123'), f'Hi {index}')
+        response, several = inbox_queries()
+        self.assertEqual(single, several)
+
+        conversations = list(response.context['conversations'])
+        self.assertEqual(len(conversations), 4)
+        self.assertEqual(conversations[0].last_message_preview, 'Hi 2')
+        self.assertEqual(conversations[0].unread_count, 1)
+        self.assertEqual(conversations[0].counterpart.username, 'peer2')
+
     def test_report_creation_and_visibility(self):
         # Users can create reports for content and later view their own reports
         request_obj = Request.objects.create(
@@ -536,4 +1631,29 @@ class SkillSwapTests(TestCase):
         self.user.is_staff = True
         self.user.save(update_fields=['is_staff'])
         response = self.client.get(reverse('skillswap:mod-reports'))
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+
+
+class ActivityFlushThreadTests(TransactionTestCase):
+    # The flush thread has its own database connection, so it needs committed rows to write to
+
+    def wait_for_path(self, user, path):
+        for _ in range(100):
+            user.profile.refresh_from_db()
+            if user.profile.last_path == path:
+                return True
+            time.sleep(0.05)
+        return False
+
+    @override_settings(SKILLSWAP_ACTIVITY_FLUSH_INTERVAL=3600, SKILLSWAP_ACTIVITY_FLUSH_SIZE=1)
+    def test_full_batch_wakes_the_flush_thread(self):
+        user = User.objects.create_user(username='alice', password='password123')
+        ActivityBuffer().record(user.pk, timezone.now(), '/dashboard/')
+        self.assertTrue(self.wait_for_path(user, '/dashboard/'))
+
+    @override_settings(SKILLSWAP_ACTIVITY_FLUSH_INTERVAL=0.1, SKILLSWAP_ACTIVITY_FLUSH_SIZE=100)
+    def test_quiet_worker_flushes_after_the_interval(self):
+        # Nobody else visits, and the visit is still written once the interval has passed
+        user = User.objects.create_user(username='alice', password='password123')
+        ActivityBuffer().record(user.pk, timezone.now(), '/inbox/')
+        self.assertTrue(self.wait_for_path(user, '/inbox/'))
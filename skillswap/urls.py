@@ -26,6 +26,7 @@ urlpatterns = [
     # Skill management
     path('skills/', views.my_skills_view, name='my-skills'),
     path('skills/add/', views.user_skill_create, name='user-skill-add'),
+    path('skills/autocomplete/', views.skill_autocomplete, name='skill-autocomplete'),
     path('skills/<int:pk>/edit/', views.user_skill_update, name='user-skill-edit'),
     path('skills/<int:pk>/delete/', views.user_skill_delete, name='user-skill-delete'),
 
@@ -43,11 +44,16 @@ urlpatterns = [
     # Notification pages
     path('notifications/', views.notification_list, name='notifications'),
     path('notifications/<int:pk>/read/', views.notification_mark_read, name='notification-read'),
+    path('notifications/read-all/', views.notification_mark_all_read, name='notifications-read-all'),
 
     # Inbox and messaging
     path('inbox/', views.inbox_list, name='inbox'),
+    path('inbox/read-all/', views.inbox_mark_all_read, name='inbox-read-all'),
     path('inbox/<int:match_id>/', views.inbox_detail, name='inbox-detail'),
     path('inbox/<int:match_id>/send/', views.inbox_send, name='inbox-send'),
+    path('inbox/<int:match_id>/older/', views.inbox_older, name='inbox-older'),
+    path('inbox/<int:match_id>/stream/', views.inbox_stream, name='inbox-stream'),
+    path('inbox/<int:match_id>/since/', views.inbox_since, name='inbox-since'),
 
     # Report related pages
     path('report/', views.report_form, name='report'),
@@ -1,20 +1,47 @@
+import asyncio
+import hashlib
+import json
+from contextlib import aclosing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.contenttypes.models import ContentType
-from django.db import IntegrityError
-from django.db.models import Avg, Count, F, Max, Prefetch, Q
-from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.core.exceptions import BadRequest
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Case, Count, Exists, F, IntegerField, OuterRef, Prefetch, Q, Value, When
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import NoReverseMatch, reverse_lazy
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
 from django.views.generic import DetailView, ListView, TemplateView, UpdateView
 
+from .autocomplete import get_skill_index
+from .counters import (
+    NOTIFICATION_ORDERING,
+    NOTIFICATIONS,
+    adjust_unread,
+    mark_all_conversations_read,
+    mark_all_notifications_read,
+    mark_conversation_read,
+)
 from .forms import FeedbackForm, MatchInviteForm, MessageForm, ProfileForm, RegistrationForm, ReportForm, RequestForm, \
     UserSkillForm
-
+from .middleware import get_viewer
 from .models import (
     Block,
     Conversation,
@@ -28,11 +55,21 @@ from .models import (
     Skill,
     UserSkill,
     blocked_user_ids,
-    is_blocked,
 )
+from .pagination import CachedCountPaginator, decode_cursor, encode_cursor, keyset_paginate
+from .realtime import CATCH_UP_LIMIT, get_broker, message_payload, messages_after
+from .recommendations import matrix_recommended_partners
+from .search import search_request_ids
 
 User = get_user_model()
 
+# Chat history is shown newest page first, in pages of this size
+MESSAGE_ORDERING = ('-created_at', '-id')
+MESSAGE_PAGE_SIZE = 50
+# Comment lines keep idle event streams open through proxies
+STREAM_HEARTBEAT_SECONDS = 15
+NOTIFICATION_PAGE_SIZE = 20
+
 
 class HomeView(TemplateView):
     # Home page of the app
@@ -75,7 +112,7 @@ class DashboardView(TemplateView):
         user = self.request.user
 
         # Load profile, skills, requests, matches and recommendations
-        context['profile'] = user.profile
+        context['profile'] = get_viewer(self.request).profile
         context['offers'] = user.user_skills.filter(type=UserSkill.SkillType.OFFER)
         context['wants'] = user.user_skills.filter(type=UserSkill.SkillType.WANT)
         context['requests'] = user.requests.select_related('skill')
@@ -89,9 +126,8 @@ class ProfileDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'profile'
 
     def get_object(self, queryset=None):
-        # Find profile by username from URL
-        user = get_object_or_404(User, username=self.kwargs['username'])
-        return user.profile
+        # Find profile by username from URL (with the user in the same query)
+        return get_object_or_404(Profile.objects.select_related('user'), user__username=self.kwargs['username'])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -107,11 +143,9 @@ class ProfileDetailView(LoginRequiredMixin, DetailView):
         context['wants'] = self.object.user.user_skills.filter(type=UserSkill.SkillType.WANT).select_related('skill')
 
         # Check block relationship between current user and profile owner
-        context['is_blocked'] = is_blocked(self.request.user, self.object.user)
-        context['has_blocked'] = Block.objects.filter(
-            blocker=self.request.user,
-            blocked=self.object.user,
-        ).exists()
+        viewer = get_viewer(self.request)
+        context['is_blocked'] = viewer.is_blocked(self.object.user)
+        context['has_blocked'] = viewer.has_blocked(self.object.user)
         return context
 
 
@@ -123,11 +157,14 @@ class ProfileUpdateView(LoginRequiredMixin, UpdateView):
     success_url = reverse_lazy('skillswap:dashboard')
 
     def get_object(self, queryset=None):
-        return self.request.user.profile
+        return get_viewer(self.request).profile
 
     def form_valid(self, form):
+        # Save only the edited fields so the unread counters are not overwritten with stale values
+        self.object = form.save(commit=False)
+        self.object.save(update_fields=list(form.fields))
         messages.success(self.request, 'Profile updated successfully.')
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
 
 
 @login_required
@@ -169,6 +206,12 @@ def my_skills_view(request):
     return render(request, 'skillswap/my_skills.html', {'offers': offers, 'wants': wants})
 
 
+@login_required
+def skill_autocomplete(request):
+    # Skills whose name starts with ?q=, served from this worker's in-memory prefix index
+    return JsonResponse({'results': get_skill_index().suggest(request.GET.get('q', ''))})
+
+
 @login_required
 def user_skill_create(request):
     # Add a new user skill
@@ -177,7 +220,7 @@ def user_skill_create(request):
         if form.is_valid():
             user_skill = form.save(commit=False)
             user_skill.user = request.user
-            user_skill.profile = request.user.profile
+            user_skill.profile = get_viewer(request).profile
             try:
                 user_skill.save()
                 messages.success(request, 'Skill saved.')
@@ -198,7 +241,7 @@ def user_skill_update(request, pk):
         form = UserSkillForm(request.POST, instance=user_skill)
         if form.is_valid():
             updated_skill = form.save(commit=False)
-            updated_skill.profile = request.user.profile
+            updated_skill.profile = get_viewer(request).profile
             updated_skill.save()
             messages.success(request, 'Skill updated.')
             return redirect('skillswap:my-skills')
@@ -276,8 +319,9 @@ class RequestDetailView(LoginRequiredMixin, DetailView):
             partner=req.user,
             status=Match.Status.PENDING,
         ).first()
-        context['is_bookmarked'] = self.request.user.profile.bookmarked_requests.filter(pk=req.pk).exists()
-        context['is_blocked'] = is_blocked(self.request.user, req.user)
+        viewer = get_viewer(self.request)
+        context['is_bookmarked'] = viewer.profile.bookmarked_requests.filter(pk=req.pk).exists()
+        context['is_blocked'] = viewer.is_blocked(req.user)
         return context
 
 
@@ -293,10 +337,58 @@ def request_close(request, pk):
     return render(request, 'skillswap/request_close_confirm.html', {'request_obj': req})
 
 
-class ExploreRequestListView(LoginRequiredMixin, ListView):
+class KeysetPaginationMixin:
+    """ListView mixin that pages by cursor over `keyset_ordering` when SKILLSWAP_EXPLORE_PAGINATION is "keyset".
+
+    `?cursor=` continues after a row and `?before=` goes back, so no page needs a COUNT or an OFFSET scan.
+    """
+
+    keyset_ordering = None
+
+    def paginate_queryset(self, queryset, page_size):
+        if settings.SKILLSWAP_EXPLORE_PAGINATION != 'keyset' or not self.keyset_ordering:
+            return super().paginate_queryset(queryset, page_size)
+
+        token = self.request.GET.get('before') or self.request.GET.get('cursor')
+        cursor = None
+        if token:
+            cursor = decode_cursor(token, queryset.model, self.keyset_ordering)
+            if cursor is None:
+                raise BadRequest('Invalid cursor.')
+        page = keyset_paginate(
+            queryset,
+            self.keyset_ordering,
+            cursor=cursor,
+            per_page=page_size,
+            backwards='before' in self.request.GET,
+        )
+        # There is no Paginator; templates tell the modes apart by it
+        return None, page, page.items, page.has_next or page.has_previous
+
+
+class CachedCountMixin:
+    """ListView mixin whose numbered pages reuse a cached, capped result count between page flips."""
+
+    paginator_class = CachedCountPaginator
+
+    def get_count_key(self):
+        # The filters as get_queryset applied them (stored in self.count_filters) plus everyone excluded
+        # from the results: the viewer and their block list
+        excluded = sorted(get_viewer(self.request).blocked_ids | {self.request.user.pk})
+        filters = sorted(getattr(self, 'count_filters', {}).items())
+        digest = hashlib.sha256(json.dumps([filters, excluded]).encode()).hexdigest()
+        return f'skillswap:explore-count:{type(self).__name__}:{digest}'
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return super().get_paginator(
+            queryset, per_page, orphans, allow_empty_first_page, count_key=self.get_count_key(), **kwargs)
+
+
+class ExploreRequestListView(LoginRequiredMixin, KeysetPaginationMixin, CachedCountMixin, ListView):
     template_name = 'skillswap/explore_requests.html'
     context_object_name = 'requests'
     paginate_by = 10
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         # Start with open requests
@@ -305,18 +397,32 @@ class ExploreRequestListView(LoginRequiredMixin, ListView):
         # Exclude current user and blocked users
         if self.request.user.is_authenticated:
             queryset = queryset.exclude(user=self.request.user)
-            blocked_ids = blocked_user_ids(self.request.user)
+            blocked_ids = get_viewer(self.request).blocked_ids
             if blocked_ids:
                 queryset = queryset.exclude(user__in=blocked_ids)
 
         # Support keyword and category filters
         q = self.request.GET.get('q')
         category = self.request.GET.get('category')
-        if q:
-            queryset = queryset.filter(
-                Q(title__icontains=q) | Q(description__icontains=q) | Q(skill__name__icontains=q))
+        # Both filters ignore case, so the cached count is shared between spellings
+        self.count_filters = {'q': (q or '').lower(), 'category': (category or '').lower()}
         if category:
             queryset = queryset.filter(skill__category__icontains=category)
+        if q:
+            # Ranked full-text search where the database has an index, plain substring matching otherwise.
+            # The filters above go into the search itself, so its cap only counts requests shown here
+            ranked_ids = search_request_ids(q, within=queryset)
+            if ranked_ids is None:
+                queryset = queryset.filter(
+                    Q(title__icontains=q) | Q(description__icontains=q) | Q(skill__name__icontains=q))
+            else:
+                rank = Case(
+                    *[When(pk=pk, then=position) for position, pk in enumerate(ranked_ids)],
+                    output_field=IntegerField(),
+                )
+                queryset = queryset.filter(pk__in=ranked_ids).order_by(rank)
+                # Ranked results are capped, so they keep numbered pages in their rank order
+                self.keyset_ordering = None
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -332,7 +438,7 @@ def bookmark_toggle(request, pk):
         return HttpResponseForbidden('Invalid method.')
 
     request_obj = get_object_or_404(Request, pk=pk)
-    profile = request.user.profile
+    profile = get_viewer(request).profile
 
     # Toggle bookmarked state
     if profile.bookmarked_requests.filter(pk=request_obj.pk).exists():
@@ -349,15 +455,42 @@ def bookmark_toggle(request, pk):
 @login_required
 def bookmark_list(request):
     # Show current user's bookmarked requests
-    bookmarks = request.user.profile.bookmarked_requests.select_related('skill', 'user').order_by('-created_at')
+    bookmarks = get_viewer(request).profile.bookmarked_requests.select_related('skill', 'user').order_by('-created_at')
     return render(request, 'skillswap/bookmarks.html', {'bookmarks': bookmarks})
 
 
 @login_required
 def notification_list(request):
     # Show notifications for current user
-    notifications = request.user.notifications.select_related('actor', 'match', 'request')
-    return render(request, 'skillswap/notifications.html', {'notifications': notifications})
+    notifications = request.user.notifications.select_related('actor', 'match', 'match__request', 'request')
+    unread_only = request.GET.get('unread') == '1'
+    if unread_only:
+        # is_read=False compiles to NOT is_read, which SQLite cannot match against the (user, is_read, created_at)
+        # index; the IN form lets that index serve both the filter and the ordering
+        notifications = notifications.filter(is_read__in=[False])
+
+    cursor = None
+    if request.GET.get('cursor'):
+        cursor = decode_cursor(request.GET['cursor'], Notification, NOTIFICATION_ORDERING)
+        if cursor is None:
+            return HttpResponseBadRequest('Invalid cursor.')
+    page = keyset_paginate(notifications, NOTIFICATION_ORDERING, cursor=cursor, per_page=NOTIFICATION_PAGE_SIZE)
+
+    # "Mark all as read" is offered on the first page and covers notifications up to the newest one shown
+    newest_cursor = None
+    if cursor is None and page.items:
+        newest_cursor = encode_cursor([page.items[0].created_at, page.items[0].pk])
+    return render(
+        request,
+        'skillswap/notifications.html',
+        {
+            'notifications': page.items,
+            'next_cursor': page.next_cursor,
+            'is_first_page': cursor is None,
+            'unread_only': unread_only,
+            'newest_cursor': newest_cursor,
+        },
+    )
 
 
 @login_required
@@ -367,44 +500,51 @@ def notification_mark_read(request, pk):
         return HttpResponseForbidden('Invalid method.')
 
     notification = get_object_or_404(Notification, pk=pk, user=request.user)
-    if not notification.is_read:
-        notification.is_read = True
-        notification.save(update_fields=['is_read'])
-        messages.success(request, 'Notification marked as read.')
+    with transaction.atomic():
+        # The conditional update makes a double submit count only once
+        if Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True):
+            adjust_unread(request.user.pk, NOTIFICATIONS, -1)
+            messages.success(request, 'Notification marked as read.')
     return redirect('skillswap:notifications')
 
 
 @login_required
-def inbox_list(request):
-    user = request.user
+def notification_mark_all_read(request):
+    # Mark every unread notification read at once, optionally only those up to the newest one shown
+    if request.method != 'POST':
+        return HttpResponseForbidden('Invalid method.')
 
-    # Find accepted/completed matches for this user
-    matches = Match.objects.filter(
-        Q(requester=user) | Q(partner=user),
-        status__in=[Match.Status.ACCEPTED, Match.Status.COMPLETED],
-    )
+    before = None
+    if request.POST.get('before'):
+        before = decode_cursor(request.POST['before'], Notification, NOTIFICATION_ORDERING)
+        if before is None:
+            return HttpResponseBadRequest('Invalid cursor.')
+
+    with transaction.atomic():
+        marked = mark_all_notifications_read(request.user.pk, before=before)
+    if marked:
+        messages.success(request, f'{marked} notification(s) marked as read.')
+    return redirect('skillswap:notifications')
 
-    # Make sure each match has a conversation
-    for match in matches:
-        Conversation.objects.get_or_create(match=match)
 
-    # Load conversation list with last message time and unread count
+@login_required
+def inbox_list(request):
+    user = request.user
+
+    # Conversations are created when a match is accepted and carry a snapshot of their latest message,
+    # so one query over the conversations table loads the whole inbox
     conversations = (
         Conversation.objects.filter(
             Q(match__requester=user) | Q(match__partner=user),
             match__status__in=[Match.Status.ACCEPTED, Match.Status.COMPLETED],
         )
         .select_related('match', 'match__request', 'match__requester', 'match__partner')
-        .annotate(
-            last_message_at=Max('messages__created_at'),
-            unread_count=Count('messages', filter=Q(messages__is_read=False) & ~Q(messages__sender=user)),
-        )
-        .order_by('-last_message_at', '-created_at')
+        .order_by(F('last_message_at').desc(nulls_last=True), '-created_at')
     )
 
     # Add some helpful attributes for display
     for conversation in conversations:
-        conversation.last_message = conversation.messages.order_by('-created_at').first()
+        conversation.unread_count = conversation.unread_count_for(user)
         conversation.counterpart = (
             conversation.match.partner
             if conversation.match.requester == user
@@ -413,6 +553,19 @@ def inbox_list(request):
     return render(request, 'skillswap/inbox_list.html', {'conversations': conversations})
 
 
+@login_required
+def inbox_mark_all_read(request):
+    # Clear the unread messages of every conversation in one go
+    if request.method != 'POST':
+        return HttpResponseForbidden('Invalid method.')
+
+    with transaction.atomic():
+        marked = mark_all_conversations_read(request.user.pk)
+    if marked:
+        messages.success(request, f'{marked} message(s) marked as read.')
+    return redirect('skillswap:inbox')
+
+
 @login_required
 def inbox_detail(request, match_id):
     # Only participants in the match can open this conversation
@@ -426,20 +579,29 @@ def inbox_detail(request, match_id):
 
     conversation, _ = Conversation.objects.get_or_create(match=match)
     counterpart = match.partner if request.user == match.requester else match.requester
-    is_blocked_flag = is_blocked(request.user, counterpart)
+    is_blocked_flag = get_viewer(request).is_blocked(counterpart)
 
     # Mark received unread messages as read
-    Message.objects.filter(conversation=conversation, sender=counterpart, is_read=False).update(is_read=True)
+    with transaction.atomic():
+        mark_conversation_read(conversation, match.requester_id, request.user.pk)
 
     message_form = MessageForm()
-    conversation_messages = conversation.messages.select_related('sender')
+    # Only the latest page is rendered; older pages are loaded by cursor from inbox_older
+    page = keyset_paginate(
+        conversation.messages.select_related('sender'),
+        MESSAGE_ORDERING,
+        per_page=MESSAGE_PAGE_SIZE,
+    )
     return render(
         request,
         'skillswap/inbox_detail.html',
         {
             'match': match,
             'conversation': conversation,
-            'conversation_messages': conversation_messages,
+            'conversation_messages': page.items[::-1],
+            'older_cursor': page.next_cursor,
+            # The live stream starts after the newest message already on the page
+            'latest_message_id': page.items[0].pk if page.items else 0,
             'message_form': message_form,
             'counterpart': counterpart,
             'is_blocked': is_blocked_flag,
@@ -447,6 +609,167 @@ def inbox_detail(request, match_id):
     )
 
 
+@login_required
+def inbox_older(request, match_id):
+    # Return the page of messages before the given cursor as an HTML fragment
+    match = get_object_or_404(Match, pk=match_id)
+    if request.user not in {match.requester, match.partner}:
+        return HttpResponseForbidden('Not allowed.')
+
+    if match.status not in {Match.Status.ACCEPTED, Match.Status.COMPLETED}:
+        return HttpResponseForbidden('Conversation not available.')
+
+    cursor = decode_cursor(request.GET.get('cursor', ''), Message, MESSAGE_ORDERING)
+    if cursor is None:
+        return HttpResponseBadRequest('Invalid cursor.')
+
+    page = keyset_paginate(
+        Message.objects.filter(conversation__match=match).select_related('sender'),
+        MESSAGE_ORDERING,
+        cursor=cursor,
+        per_page=MESSAGE_PAGE_SIZE,
+    )
+    return render(
+        request,
+        'skillswap/partials/conversation_messages.html',
+        {
+            'match': match,
+            'conversation_messages': page.items[::-1],
+            'older_cursor': page.next_cursor,
+        },
+    )
+
+
+@login_required
+def inbox_since(request, match_id):
+    # Compact JSON of the messages after ?after=<id>, for clients that poll
+    try:
+        after_id = int(request.GET.get('after', 0))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor.')
+
+    # The conversation snapshot alone decides whether anything changed, so idle polls read one row
+    snapshot = (
+        Conversation.objects.filter(match_id=match_id)
+        .values_list(
+            'pk',
+            'last_message_at',
+            'requester_unread_count',
+            'partner_unread_count',
+            'match__requester_id',
+            'match__partner_id',
+            'match__status',
+        )
+        .first()
+    )
+    if snapshot is None:
+        raise Http404('Conversation not found.')
+    conversation_id, last_message_at, requester_unread, partner_unread, requester_id, partner_id, status = snapshot
+    if request.user.pk not in {requester_id, partner_id}:
+        return HttpResponseForbidden('Not allowed.')
+    if status not in {Match.Status.ACCEPTED, Match.Status.COMPLETED}:
+        return HttpResponseForbidden('Conversation not available.')
+
+    unread_count = requester_unread if request.user.pk == requester_id else partner_unread
+    last_seen = last_message_at.timestamp() if last_message_at else 0
+    etag = quote_etag(f'{conversation_id}-{after_id}-{last_seen}-{unread_count}')
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    new_messages = [
+        message_payload(message)
+        for message in Message.objects.filter(conversation_id=conversation_id, id__gt=after_id)
+        .select_related('sender')
+        .order_by('id')[:CATCH_UP_LIMIT]
+    ]
+    response = JsonResponse({
+        'messages': new_messages,
+        'unread_count': unread_count,
+        'cursor': new_messages[-1]['id'] if new_messages else after_id,
+    })
+    response['ETag'] = etag
+    # Make browsers revalidate instead of reusing the response blindly
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _mark_streamed_messages_read(conversation, requester_id, user_id):
+    with transaction.atomic():
+        mark_conversation_read(conversation, requester_id, user_id)
+
+
+def _sse_event(payload):
+    return f'id: {payload["id"]}\ndata: {json.dumps(payload)}\n\n'
+
+
+@login_required
+async def inbox_stream(request, match_id):
+    # Server-Sent Events stream of new messages in a conversation
+    user = await request.auser()
+    match = await Match.objects.filter(pk=match_id).afirst()
+    if match is None:
+        raise Http404('Match not found.')
+    if user.pk not in {match.requester_id, match.partner_id}:
+        return HttpResponseForbidden('Not allowed.')
+
+    if match.status not in {Match.Status.ACCEPTED, Match.Status.COMPLETED}:
+        return HttpResponseForbidden('Conversation not available.')
+
+    conversation, _ = await Conversation.objects.aget_or_create(match=match)
+
+    # Resume after the last message the client has (browsers send Last-Event-ID on reconnect)
+    after = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    try:
+        after_id = int(after)
+    except (TypeError, ValueError):
+        after_id = await (
+            Message.objects.filter(conversation=conversation).order_by('-id').values_list('id', flat=True).afirst()
+        ) or 0
+
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI an open stream would hold a worker thread for its whole life, so answer like a poll:
+        # send what is new and close, and EventSource reconnects after the poll interval with Last-Event-ID
+        batch = await messages_after(conversation.pk, after_id)
+        if any(payload['sender_id'] != user.pk for payload in batch):
+            await sync_to_async(_mark_streamed_messages_read)(conversation, match.requester_id, user.pk)
+        retry = int(settings.SKILLSWAP_REALTIME_POLL_INTERVAL * 1000)
+        response = HttpResponse(
+            f'retry: {retry}\n\n' + ''.join(_sse_event(payload) for payload in batch),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        # Streams are closed after a while; EventSource reconnects on its own with Last-Event-ID
+        deadline = loop.time() + settings.SKILLSWAP_REALTIME_STREAM_SECONDS
+        last_write = loop.time()
+        yield 'retry: 3000\n\n'
+        async with aclosing(get_broker().listen(conversation.pk, after_id)) as batches:
+            async for batch in batches:
+                for payload in batch:
+                    yield _sse_event(payload)
+                if batch:
+                    last_write = loop.time()
+                    # The reader is looking at the conversation, so incoming messages count as read
+                    if any(payload['sender_id'] != user.pk for payload in batch):
+                        await sync_to_async(_mark_streamed_messages_read)(conversation, match.requester_id, user.pk)
+                elif loop.time() - last_write >= STREAM_HEARTBEAT_SECONDS:
+                    last_write = loop.time()
+                    yield ': keepalive\n\n'
+                if loop.time() >= deadline:
+                    break
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def inbox_send(request, match_id):
     # Send a message in a conversation
@@ -458,7 +781,7 @@ def inbox_send(request, match_id):
         return HttpResponseForbidden('Conversation not available.')
 
     counterpart = match.partner if request.user == match.requester else match.requester
-    if is_blocked(request.user, counterpart):
+    if get_viewer(request).is_blocked(counterpart):
         return HttpResponseForbidden('Messaging is blocked.')
 
     if request.method != 'POST':
@@ -471,16 +794,19 @@ def inbox_send(request, match_id):
         message.conversation = conversation
         message.sender = request.user
         message.save()
+        # Push the message to open streams once it is visible to other connections
+        transaction.on_commit(lambda: get_broker().publish_message(message))
         messages.success(request, 'Message sent.')
     else:
         messages.error(request, 'Please enter a message.')
     return redirect('skillswap:inbox-detail', match_id=match.pk)
 
 
-class ExploreUserListView(LoginRequiredMixin, ListView):
+class ExploreUserListView(LoginRequiredMixin, KeysetPaginationMixin, CachedCountMixin, ListView):
     template_name = 'skillswap/explore_users.html'
     context_object_name = 'users'
     paginate_by = 12
+    keyset_ordering = ('username', 'id')
 
     def get_queryset(self):
         # Start from all users with related profile
@@ -489,18 +815,24 @@ class ExploreUserListView(LoginRequiredMixin, ListView):
         # Remove current user and blocked users
         if self.request.user.is_authenticated:
             queryset = queryset.exclude(pk=self.request.user.pk)
-            blocked_ids = blocked_user_ids(self.request.user)
+            blocked_ids = get_viewer(self.request).blocked_ids
             if blocked_ids:
                 queryset = queryset.exclude(pk__in=blocked_ids)
 
-        # Optional filters by skill name and skill type
+        # Optional filters by skill name and skill type, which must hold for the same skill entry
         skill_query = self.request.GET.get('skill')
         skill_type = self.request.GET.get('type')
+        self.count_filters = {'skill': (skill_query or '').lower(), 'type': ''}
+        skills = UserSkill.objects.filter(user=OuterRef('pk'))
         if skill_query:
-            queryset = queryset.filter(user_skills__skill__name__icontains=skill_query)
+            skills = skills.filter(skill__name__icontains=skill_query)
         if skill_type in {UserSkill.SkillType.OFFER, UserSkill.SkillType.WANT}:
-            queryset = queryset.filter(user_skills__type=skill_type)
-        return queryset.distinct()
+            skills = skills.filter(type=skill_type)
+            self.count_filters['type'] = skill_type
+        # A semi-join probing the (user, skill, type) index, so users are never duplicated and need no DISTINCT
+        if skill_query or self.count_filters['type']:
+            queryset = queryset.filter(Exists(skills))
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -516,7 +848,7 @@ def match_create(request, pk):
     if req.user == request.user:
         return HttpResponseForbidden('Cannot match your own request.')
 
-    if is_blocked(request.user, req.user):
+    if get_viewer(request).is_blocked(req.user):
         return HttpResponseForbidden('Cannot send a match invite to this user.')
 
     if request.method == 'POST':
@@ -560,7 +892,8 @@ class MatchDetailView(LoginRequiredMixin, DetailView):
         context['feedback_entries'] = match.feedback.select_related('rater', 'ratee')
         existing_feedback = match.feedback.filter(rater=self.request.user).first()
         context['existing_feedback'] = existing_feedback
-        context['is_blocked'] = is_blocked(match.requester, match.partner)
+        counterpart = match.partner if self.request.user == match.requester else match.requester
+        context['is_blocked'] = get_viewer(self.request).is_blocked(counterpart)
         if match.status == Match.Status.COMPLETED and existing_feedback is None:
             context['feedback_form'] = FeedbackForm()
         return context
@@ -577,17 +910,12 @@ def match_action(request, pk, action):
     if action in {'accept', 'reject'} and request.user != match.partner:
         return HttpResponseForbidden('Only the recipient can respond.')
 
-    if action == 'accept' and match.status == Match.Status.PENDING:
-        match.status = Match.Status.ACCEPTED
-        match.save(update_fields=['status'])
+    # transition() only succeeds from the expected status, so a second click or a racing request is refused
+    if action == 'accept' and match.transition(Match.Status.ACCEPTED):
         messages.success(request, 'Match accepted.')
-    elif action == 'reject' and match.status == Match.Status.PENDING:
-        match.status = Match.Status.REJECTED
-        match.save(update_fields=['status'])
+    elif action == 'reject' and match.transition(Match.Status.REJECTED):
         messages.info(request, 'Match rejected.')
-    elif action == 'complete' and match.status == Match.Status.ACCEPTED:
-        match.status = Match.Status.COMPLETED
-        match.save(update_fields=['status'])
+    elif action == 'complete' and match.transition(Match.Status.COMPLETED):
         messages.success(request, 'Match marked completed.')
     else:
         messages.warning(request, 'Action not available.')
@@ -753,21 +1081,28 @@ def _safe_target_url(target):
 
 
 def get_recommended_partners(user, q=None, mode=None, limit=None):
+    # Optionally score candidates in memory instead of in the database
+    if getattr(settings, 'SKILLSWAP_RECOMMENDATION_BACKEND', 'index') == 'matrix':
+        return matrix_recommended_partners(user, q=q, mode=mode, limit=limit, exclude_ids=blocked_user_ids(user))
+
     # Get skills the current user wants to learn
     want_skills = UserSkill.objects.filter(user=user, type=UserSkill.SkillType.WANT)
     if q:
         want_skills = want_skills.filter(skill__name__icontains=q)
-    want_skill_ids = list(want_skills.values_list('skill_id', flat=True))
-    if not want_skill_ids:
-        return User.objects.none()
-
-    # Get skills the current user can offer
-    offer_skill_ids = list(
-        UserSkill.objects.filter(user=user, type=UserSkill.SkillType.OFFER).values_list('skill_id', flat=True)
-    )
+        want_skill_ids = list(want_skills.values_list('skill_id', flat=True))
+        if not want_skill_ids:
+            return User.objects.none()
+        # A keyword narrows the wanted skills, so the overlap has to be counted live
+        qs = _score_partners_live(user, want_skill_ids)
+        tie_break = 'pk'
+    else:
+        # Without a keyword the precomputed scores can be read directly. Ties go by the stored candidate id,
+        # the last column of the score index, so the rows come out of the index already in order
+        want_skill_ids = want_skills.values('skill_id')
+        qs = _score_partners_from_index(user)
+        tie_break = 'recommended_to__candidate'
 
-    # Start building candidate user queryset
-    qs = User.objects.select_related('profile').exclude(pk=user.pk)
+    # Remove blocked users in either direction
     blocked_ids = blocked_user_ids(user)
     if blocked_ids:
         qs = qs.exclude(pk__in=blocked_ids)
@@ -776,8 +1111,40 @@ def get_recommended_partners(user, q=None, mode=None, limit=None):
     if mode in {choice[0] for choice in Profile.PreferredMode.choices}:
         qs = qs.filter(profile__preferred_mode=mode)
 
+    # Prefetch only matching offered skills to display later
+    qs = qs.prefetch_related(
+        Prefetch(
+            'user_skills',
+            queryset=UserSkill.objects.filter(
+                type=UserSkill.SkillType.OFFER,
+                skill_id__in=want_skill_ids,
+            ).select_related('skill'),
+            to_attr='matching_offers',
+        ),
+    ).order_by('-final_score', '-overlap_want_offer', tie_break)
+
+    if limit:
+        return qs[:limit]
+    return qs
+
+
+def _score_partners_from_index(user):
+    # Read the scores kept up to date in PartnerRecommendation
+    return User.objects.select_related('profile').filter(recommended_to__user=user).annotate(
+        overlap_want_offer=F('recommended_to__overlap_want_offer'),
+        mutual_overlap=F('recommended_to__mutual_overlap'),
+        final_score=F('recommended_to__final_score'),
+    )
+
+
+def _score_partners_live(user, want_skill_ids):
+    # Get skills the current user can offer
+    offer_skill_ids = list(
+        UserSkill.objects.filter(user=user, type=UserSkill.SkillType.OFFER).values_list('skill_id', flat=True)
+    )
+
     # Count skill overlap between current user and possible partners
-    qs = qs.annotate(
+    qs = User.objects.select_related('profile').exclude(pk=user.pk).annotate(
         overlap_want_offer=Count(
             'user_skills__skill',
             filter=Q(
@@ -786,33 +1153,23 @@ def get_recommended_partners(user, q=None, mode=None, limit=None):
             ),
             distinct=True,
         ),
-        mutual_overlap=Count(
+    ).filter(overlap_want_offer__gt=0)
+
+    # An empty IN () filter would turn the whole score expression into 0, so use a constant instead
+    if offer_skill_ids:
+        mutual_overlap = Count(
             'user_skills__skill',
             filter=Q(
                 user_skills__type=UserSkill.SkillType.WANT,
                 user_skills__skill_id__in=offer_skill_ids,
             ),
             distinct=True,
-        ),
-    ).filter(overlap_want_offer__gt=0)
+        )
+    else:
+        mutual_overlap = Value(0)
+    qs = qs.annotate(mutual_overlap=mutual_overlap)
 
     # Final score combines direct matches and mutual learning interest
-    qs = qs.annotate(
+    return qs.annotate(
         final_score=F('overlap_want_offer') + F('mutual_overlap'),
     )
-
-    # Prefetch only matching offered skills to display later
-    qs = qs.prefetch_related(
-        Prefetch(
-            'user_skills',
-            queryset=UserSkill.objects.filter(
-                type=UserSkill.SkillType.OFFER,
-                skill_id__in=want_skill_ids,
-            ).select_related('skill'),
-            to_attr='matching_offers',
-        ),
-    ).order_by('-final_score', '-overlap_want_offer', 'username')
-
-    if limit:
-        return qs[:limit]
-    return qs
\ No newline at end of file